@@ -628,21 +628,6 @@ ACTS_REGISTRY: Dict[str, Dict] = {
 }
 
 
-def detect_act_from_query(query: str) -> Optional[str]:
-    """Detect if user is asking about a specific Act using the registry."""
-    query_lower = query.lower()
-
-    for short_name, act_info in ACTS_REGISTRY.items():
-        if any(kw in query_lower for kw in act_info["keywords"]):
-            # Return the base name for filtering (e.g., "Residential Tenancies")
-            title = act_info["title"]
-            # Extract the base name (without year)
-            base_name = title.rsplit(" Act", 1)[0] if " Act" in title else title
-            return base_name
-
-    return None
-
-
 def get_all_acts() -> List[Dict]:
     """Get all acts as a list for the API."""
     return [
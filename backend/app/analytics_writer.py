@@ -0,0 +1,219 @@
+"""
+analytics_writer.py
+
+Background writer for Supabase logging.
+
+Request handlers enqueue rows and return immediately. A background task
+drains the queue every flush interval (or as soon as a full batch is
+waiting), groups the rows by table and writes each group with one bulk
+insert, retrying transient failures with exponential backoff. A batch
+rejected for its data (e.g. one row with an invalid value) is split in
+halves until the offending rows are isolated, so only they are lost; any
+other rejection (permissions, schema, auth) fails the whole batch at once.
+Remaining rows are flushed on shutdown.
+
+Topic (per-act) query counts are summed in memory between flushes and sent
+as one increment_topic_counts call per flush (see supabase_schema.sql).
+"""
+
+import asyncio
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from .logger import logger, LogEvent
+
+# Base delay before retrying a failed write (doubles each attempt)
+RETRY_BASE_SECONDS = 0.5
+
+# SQL function applying a batch of per-act query count deltas
+TOPIC_COUNTS_RPC = "increment_topic_counts"
+
+# Error codes for requests that fail the same way on every attempt: SQLSTATE
+# classes 22 (data exception, e.g. invalid UUID), 23 (constraint violation),
+# 42 (syntax or access rule) and PostgREST request, schema and JWT errors
+PERMANENT_ERROR_CODES = ("22", "23", "42", "PGRST1", "PGRST2", "PGRST3")
+
+# The subset caused by a row's values, which other rows in the batch do not share
+ROW_ERROR_CODES = ("22", "23")
+
+_STOP = object()
+_COUNTS_PENDING = object()
+
+
+def is_permanent_error(error: Exception) -> bool:
+    """Whether retrying the same request cannot succeed (rejected data or a 4xx response)."""
+    code = getattr(error, "code", None)
+    if isinstance(code, str) and code.startswith(PERMANENT_ERROR_CODES):
+        return True
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in (408, 429)
+
+
+def is_row_error(error: Exception) -> bool:
+    """Whether the database rejected a row's data, so the rest of the batch may still succeed."""
+    code = getattr(error, "code", None)
+    return isinstance(code, str) and code.startswith(ROW_ERROR_CODES)
+
+
+class AnalyticsWriter:
+    """Batches Supabase writes off the request path."""
+
+    def __init__(self, client, flush_interval_seconds: float = 1.0, max_batch_rows: int = 200,
+                 max_retries: int = 3, max_queued_rows: int = 10000):
+        """
+        Args:
+            client: Supabase client
+            flush_interval_seconds: Longest a row waits before being written
+            max_batch_rows: Rows written per flush at most
+            max_retries: Retries per table write before the rows are dropped
+            max_queued_rows: Rows held in memory before new rows are dropped
+        """
+        self.client = client
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_batch_rows = max(1, max_batch_rows)
+        self.max_retries = max_retries
+        self.max_queued_rows = max_queued_rows
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self._topic_deltas: Counter = Counter()
+
+        self.written_rows = 0
+        self.topic_queries_counted = 0
+        self.failed_rows = 0
+        self.dropped_rows = 0
+        self.batches = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, table: str, row: Dict[str, Any]):
+        """Queue a row for the next flush."""
+        if self._closed or self._queue.qsize() >= self.max_queued_rows:
+            self.dropped_rows += 1
+            logger.track_analytics_failure(table, RuntimeError("Analytics queue full or closed, row dropped"))
+            return
+        self._queue.put_nowait((table, row))
+
+    def count_topic(self, act_name: str):
+        """Count one query about an act; the totals are sent on the next flush."""
+        if self._closed:
+            return
+        if not self._topic_deltas:
+            # Wake the flush loop for the first delta since the last flush
+            self._queue.put_nowait(_COUNTS_PENDING)
+        self._topic_deltas[act_name] += 1
+
+    async def close(self):
+        """Stop accepting rows and flush everything still queued."""
+        if self._task is None or self._closed:
+            return
+        self._closed = True
+        self._queue.put_nowait(_STOP)
+        await self._task
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval_seconds
+            while len(batch) < self.max_batch_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch: list):
+        groups: Dict[str, list] = {}
+        for item in batch:
+            if item is _COUNTS_PENDING:
+                continue
+            table, row = item
+            groups.setdefault(table, []).append(row)
+
+        self.batches += 1
+        for table, rows in groups.items():
+            await self._write(table, rows)
+
+        deltas, self._topic_deltas = self._topic_deltas, Counter()
+        if deltas:
+            await self._count_topics(deltas)
+
+    async def _write(self, table: str, rows: List[Dict[str, Any]]):
+        def execute():
+            return self.client.table(table).insert(rows).execute()
+
+        error = await self._execute(table, execute)
+        if error is None:
+            self.written_rows += len(rows)
+            logger.track_analytics_success(f"{table} ({len(rows)} rows)")
+        elif len(rows) > 1 and is_row_error(error):
+            # One bad row rejects the whole insert; split to write the others
+            middle = len(rows) // 2
+            await self._write(table, rows[:middle])
+            await self._write(table, rows[middle:])
+        else:
+            self.failed_rows += len(rows)
+            logger.track_analytics_failure(table, error)
+
+    async def _count_topics(self, deltas: Counter):
+        params = {"deltas": [{"act_name": act, "delta": delta} for act, delta in deltas.items()]}
+
+        def execute():
+            return self.client.rpc(TOPIC_COUNTS_RPC, params).execute()
+
+        error = await self._execute("topic_stats", execute)
+        if error is None:
+            self.topic_queries_counted += sum(deltas.values())
+            logger.track_analytics_success(f"topic_stats ({len(deltas)} acts)")
+        else:
+            logger.track_analytics_failure("topic_stats", error)
+            # Keep the counts for the next flush. There is one key per act,
+            # so holding them back cannot grow without bound.
+            if not self._topic_deltas and not self._closed:
+                self._queue.put_nowait(_COUNTS_PENDING)
+            self._topic_deltas.update(deltas)
+
+    async def _execute(self, operation: str, execute) -> Optional[Exception]:
+        """
+        Run a blocking Supabase call, retrying transient failures.
+        Returns None on success, otherwise the last error.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                await asyncio.to_thread(execute)
+                return None
+            except Exception as e:
+                if attempt == self.max_retries or is_permanent_error(e):
+                    return e
+                delay = RETRY_BASE_SECONDS * 2 ** attempt
+                logger.warning(
+                    LogEvent.ANALYTICS_FAILURE,
+                    f"Write to {operation} failed, retrying in {delay:.1f}s",
+                    error=str(e)
+                )
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for the health endpoint."""
+        return {
+            "queued_rows": self._queue.qsize(),
+            "written_rows": self.written_rows,
+            "pending_topic_queries": sum(self._topic_deltas.values()),
+            "topic_queries_counted": self.topic_queries_counted,
+            "failed_rows": self.failed_rows,
+            "dropped_rows": self.dropped_rows,
+            "batches": self.batches
+        }
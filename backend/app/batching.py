@@ -0,0 +1,121 @@
+"""
+batching.py
+
+Dynamic micro-batching of per-request work, in front of the retrieval pool.
+
+Request handlers await submit() with one item each. Items are queued on the
+event loop and a single collector task runs one batch at a time: it takes
+every item waiting (up to max_batch), runs the batch function once as a
+single job on the retrieval pool and hands every caller its own result.
+Items that arrive while a batch is running form the next batch, so batches
+grow with load and an idle server never waits for a batch to fill.
+
+Items waiting for a batch are capped like the retrieval pool's queue: when
+max_pending are already waiting, submit() raises QueueFullError at once.
+"""
+
+import time
+import asyncio
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from .executor import QueueFullError
+
+
+class MicroBatcher:
+    """Collects concurrent single-item awaits into batched calls."""
+
+    def __init__(self, batch_fn: Callable[[List[Any]], Sequence[Any]], max_batch: int,
+                 run: Callable[..., Awaitable[Any]], max_pending: int, name: str = "batcher"):
+        """
+        Args:
+            batch_fn: Called with a list of items, returns one result per item
+            max_batch: Largest batch passed to batch_fn
+            run: Coroutine function that runs batch_fn(items) off the event loop
+                (e.g. on the retrieval pool); its exceptions reach every caller
+            max_pending: Maximum items waiting for a batch
+            name: Collector task name
+        """
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, max_batch)
+        self.run = run
+        self.max_pending = max_pending
+        self.name = name
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self.batch_sizes: Counter = Counter()
+
+        self.rejected = 0
+        self._started = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    async def submit(self, item: Any) -> Any:
+        """Add an item to the next batch and wait for its result."""
+        if self._queue.qsize() >= self.max_pending:
+            self.rejected += 1
+            raise QueueFullError(f"{self.name} queue full ({self.max_pending} waiting)")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=self.name)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future, time.perf_counter()))
+        return await future
+
+    def _collect(self, first: tuple) -> List[tuple]:
+        batch = [first]
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+        now = time.perf_counter()
+        for _, _, enqueued_at in batch:
+            wait = now - enqueued_at
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        self._started += len(batch)
+
+        # Drop callers that gave up (e.g. the client disconnected)
+        return [(item, future) for item, future, _ in batch if not future.done()]
+
+    async def _run(self):
+        while True:
+            batch = self._collect(await self._queue.get())
+            if not batch:
+                continue
+            self.batch_sizes[len(batch)] += 1
+            try:
+                results = await self.run(self.batch_fn, [item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def close(self):
+        """Stop the collector task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and batch-size histogram for the health endpoint."""
+        batches = sum(self.batch_sizes.values())
+        items = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "max_batch": self.max_batch,
+            "max_pending": self.max_pending,
+            "queue_depth": self._queue.qsize(),
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self._total_wait / self._started * 1000, 2) if self._started else 0.0,
+            "max_wait_ms": round(self._max_wait * 1000, 2),
+            "batches": batches,
+            "items": items,
+            "avg_batch_size": round(items / batches, 2) if batches else 0.0,
+            "batch_size_histogram": {str(size): self.batch_sizes[size] for size in sorted(self.batch_sizes)}
+        }
@@ -0,0 +1,189 @@
+"""
+boosting.py
+
+Vectorized re-ranking for search results.
+Per-chunk features are computed once when the corpus is loaded, so each
+query applies its boosts as NumPy mask and multiply operations.
+"""
+
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .heading_index import HeadingIndex
+from .metadata_store import MetadataStore
+from .retrieval import RowSelection, local_positions, select
+
+# Query phrases that mark an overview ("what is ...") question
+OVERVIEW_TRIGGERS = ['what is', 'what are', 'explain', 'overview', 'purpose of']
+
+# Heading/opening-text terms boosted for overview questions
+OVERVIEW_BOOST_TERMS = ['purpose', 'interpretation', 'application', 'object', 'principle', 'definition']
+
+# Boost multipliers (kept identical to the original per-chunk loop)
+KEY_SECTION_EXACT_BOOST = 2.0  # Chunk is one of the key sections for the topic
+KEY_SECTION_ACT_BOOST = 1.3    # Chunk is from the key section's act
+OVERVIEW_TERM_BOOST = 1.3      # Per overview term found in heading or opening text
+EARLY_SECTION_BOOST = 1.2      # Sections 1-10 for overview questions
+NUMBERED_SECTION_BOOST = 1.1   # Chunk has an actual section number
+HEADING_MATCH_BOOST = 1.4      # Section heading contains a query term
+
+# Opening text searched for overview terms
+OPENING_CHARS = 200
+
+
+class BoostIndex:
+    """Precomputed per-chunk features used to boost similarity scores."""
+
+    def __init__(self, metadata: Sequence[dict]):
+        """
+        Args:
+            metadata: Chunk metadata rows. A MetadataStore is read column by
+                column, so only section numbers, headings and opening text
+                are decoded rather than whole rows.
+        """
+        n = len(metadata)
+
+        # Act ids: one code per distinct (act_title, act_short_name) pair
+        act_lookup: Dict[Tuple[str, str], int] = {}
+
+        if isinstance(metadata, MetadataStore):
+            # The store already numbers its acts; map those ids onto act codes
+            store_codes = np.array([
+                act_lookup.setdefault((act['act_title'].lower(), act['act_short_name'].lower()), len(act_lookup))
+                for act in metadata.acts
+            ], dtype=np.int32)
+            act_codes = store_codes[np.asarray(metadata.act_id)]
+            section_numbers = metadata.columns['section_number']
+            section_headings = metadata.columns['section_heading']
+            openings = metadata.columns['text'].prefixes(OPENING_CHARS)
+        else:
+            act_codes = np.empty(n, dtype=np.int32)
+            for i, meta in enumerate(metadata):
+                act_key = (meta.get('act_title', '').lower(), meta.get('act_short_name', '').lower())
+                act_codes[i] = act_lookup.setdefault(act_key, len(act_lookup))
+            section_numbers = (meta.get('section_number', '') for meta in metadata)
+            section_headings = (meta.get('section_heading', '') for meta in metadata)
+            openings = (meta.get('text', '')[:OPENING_CHARS] for meta in metadata)
+
+        # Section numbers: one code per distinct stripped section number
+        section_lookup: Dict[str, int] = {}
+        section_codes = np.empty(n, dtype=np.int32)
+
+        overview_counts = np.zeros(n, dtype=np.int8)
+
+        headings: List[str] = []
+
+        for i, (section_num, heading, opening) in enumerate(zip(section_numbers, section_headings, openings)):
+            section_codes[i] = section_lookup.setdefault(section_num.strip(), len(section_lookup))
+
+            heading_lower = heading.lower()
+            opening_lower = opening.lower()
+            overview_counts[i] = sum(
+                1 for term in OVERVIEW_BOOST_TERMS
+                if term in heading_lower or term in opening_lower
+            )
+            headings.append(heading_lower)
+
+        # Section flags, evaluated once per distinct section number
+        numbered = np.array([
+            bool(s) and s.replace('.', '').isdigit() for s in section_lookup
+        ], dtype=bool)[section_codes]
+        if isinstance(metadata, MetadataStore):
+            ordinals = np.asarray(metadata.section_ordinal)
+            early = (ordinals >= 0) & (ordinals <= 10)
+        else:
+            early = np.array([
+                s.isdigit() and int(s) <= 10 for s in section_lookup
+            ], dtype=bool)[section_codes]
+
+        self.size = n
+        self.act_keys: List[Tuple[str, str]] = list(act_lookup)
+        self.act_codes = act_codes
+        self.section_lookup = section_lookup
+        self.section_codes = section_codes
+
+        # (act, section) key per chunk, plus a sorted copy for key-section row lookups
+        self._n_sections = max(len(section_lookup), 1)
+        self.chunk_keys = act_codes.astype(np.int64) * self._n_sections + section_codes
+        self._key_order = np.argsort(self.chunk_keys, kind='stable')
+        self._sorted_keys = self.chunk_keys[self._key_order]
+        self.numbered = numbered
+        self.early = early
+        self.overview_counts = overview_counts
+
+        self.heading_index = HeadingIndex(headings)
+
+        # Precomputed multiplier tables
+        self._base = np.where(numbered, NUMBERED_SECTION_BOOST, 1.0).astype(np.float32)
+        self._overview = (
+            OVERVIEW_TERM_BOOST ** overview_counts.astype(np.float32)
+            * np.where(early, EARLY_SECTION_BOOST, 1.0)
+        ).astype(np.float32)
+
+    def _key_section_plan(self, key_sections: list) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Per-act boost and the (act, section) keys that get the exact-match boost.
+        Each act uses the first key-section entry whose act id it matches,
+        as in should_boost_section.
+        """
+        act_boost = np.ones(len(self.act_keys), dtype=np.float32)
+        exact_keys = []
+        for act_code, (act_title, act_short) in enumerate(self.act_keys):
+            for act_id, sections in key_sections:
+                act_id_lower = act_id.lower()
+                if act_id_lower in act_title or act_id_lower in act_short:
+                    act_boost[act_code] = KEY_SECTION_ACT_BOOST
+                    exact_keys.extend(
+                        act_code * self._n_sections + self.section_lookup[s]
+                        for s in sections if s in self.section_lookup
+                    )
+                    break
+        return act_boost, np.array(exact_keys, dtype=np.int64)
+
+    def key_section_multipliers(self, key_sections: list, rows: RowSelection = None) -> Optional[np.ndarray]:
+        """
+        Vectorized equivalent of should_boost_section for the selected chunks.
+        Returns None when no key sections matched the query.
+        """
+        if not key_sections:
+            return None
+
+        act_boost, exact_keys = self._key_section_plan(key_sections)
+        act_codes = select(self.act_codes, rows)
+        multipliers = act_boost[act_codes]
+        if len(exact_keys):
+            multipliers[np.isin(select(self.chunk_keys, rows), exact_keys)] = KEY_SECTION_EXACT_BOOST
+        return multipliers
+
+    def key_section_rows(self, key_sections: list) -> np.ndarray:
+        """Chunk ids that receive the exact key-section boost, in ascending order."""
+        if not key_sections:
+            return np.empty(0, dtype=np.int64)
+        _, exact_keys = self._key_section_plan(key_sections)
+        starts = np.searchsorted(self._sorted_keys, exact_keys, side='left')
+        ends = np.searchsorted(self._sorted_keys, exact_keys, side='right')
+        matches = [self._key_order[start:end] for start, end in zip(starts, ends)]
+        if not matches:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(matches))
+
+    def multipliers(self, query: str, key_sections: list, rows: RowSelection = None) -> np.ndarray:
+        """
+        Combined boost multiplier for this query.
+        Covers every chunk, or only the selected rows when rows is given.
+        """
+        query_lower = query.lower()
+        result = select(self._base, rows).copy()
+
+        key_boost = self.key_section_multipliers(key_sections, rows)
+        if key_boost is not None:
+            result *= key_boost
+
+        if any(q in query_lower for q in OVERVIEW_TRIGGERS):
+            result *= select(self._overview, rows)
+
+        heading_matches = local_positions(rows, self.heading_index.match(query_lower))
+        if len(heading_matches):
+            result[heading_matches] *= HEADING_MATCH_BOOST
+
+        return result
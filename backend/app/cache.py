@@ -0,0 +1,180 @@
+"""
+cache.py
+
+In-process caches for the retrieval and chat paths.
+"""
+
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+def normalize_query(query: str) -> str:
+    """
+    Cache key for a query: whitespace collapsed and lower-cased.
+    all-MiniLM-L6-v2 is uncased and ignores extra whitespace, so queries
+    with the same key encode to the same vector.
+    """
+    return " ".join(query.split()).lower()
+
+
+class TTLCache:
+    """Thread-safe LRU cache with a maximum size and per-entry time-to-live."""
+
+    def __init__(self, maxsize: int, ttl_seconds: Optional[float] = None):
+        """
+        Args:
+            maxsize: Maximum number of entries (0 disables the cache)
+            ttl_seconds: Entry lifetime in seconds (None = no expiry)
+        """
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None on a miss or expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for the health endpoint."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class SemanticAnswerCache:
+    """
+    Thread-safe cache of generated answers for near-duplicate questions.
+
+    Entries are grouped by a key describing everything the answer depends on
+    besides the question (corpus version, prompt version and the ids of the
+    retrieved chunks). A lookup hits when an entry in the same group was
+    stored for a query whose embedding is within the cosine threshold.
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: Optional[float] = None, threshold: float = 0.95):
+        """
+        Args:
+            maxsize: Maximum number of answers (0 disables the cache)
+            ttl_seconds: Answer lifetime in seconds (None = no expiry)
+            threshold: Minimum cosine similarity between the queries
+        """
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        # (group, query text) -> (unit query embedding, answer, expires_at)
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._groups: Dict[Hashable, set] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _unit(embedding: np.ndarray) -> np.ndarray:
+        norm = float(np.linalg.norm(embedding))
+        return embedding / norm if norm else embedding
+
+    def _remove(self, key: tuple):
+        del self._entries[key]
+        group = self._groups[key[0]]
+        group.discard(key)
+        if not group:
+            del self._groups[key[0]]
+
+    def get(self, group: Hashable, embedding: np.ndarray) -> Optional[Any]:
+        """Best cached answer in the group for a similar enough query, or None."""
+        if self.maxsize <= 0:
+            return None
+        unit = self._unit(embedding)
+        now = time.monotonic()
+        with self._lock:
+            best_key, best_score = None, self.threshold
+            for key in list(self._groups.get(group, ())):
+                cached_unit, _, expires_at = self._entries[key]
+                if expires_at is not None and expires_at <= now:
+                    self._remove(key)
+                    continue
+                score = float(cached_unit @ unit)
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key][1]
+
+    def set(self, group: Hashable, query: str, embedding: np.ndarray, answer: Any):
+        if self.maxsize <= 0:
+            return
+        key = (group, normalize_query(query))
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (self._unit(embedding), answer, expires_at)
+            self._entries.move_to_end(key)
+            self._groups.setdefault(group, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for the health endpoint."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
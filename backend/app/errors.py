@@ -25,6 +25,7 @@ class ErrorCode(str, Enum):
     ANTHROPIC_UNAVAILABLE = "ANTHROPIC_UNAVAILABLE"
     SEARCH_FAILED = "SEARCH_FAILED"
     GENERATION_FAILED = "GENERATION_FAILED"
+    SERVER_OVERLOADED = "SERVER_OVERLOADED"
 
     # Internal errors (500)
     INTERNAL_ERROR = "INTERNAL_ERROR"
@@ -155,6 +156,15 @@ def raise_anthropic_unavailable():
     )
 
 
+def raise_server_overloaded():
+    raise ServiceUnavailableError(
+        ErrorCode.SERVER_OVERLOADED,
+        "Server busy",
+        "Too many searches are queued. Please try again shortly.",
+        retry_after=5
+    )
+
+
 def raise_generation_failed(error_msg: str):
     raise InternalError(
         ErrorCode.GENERATION_FAILED,
@@ -0,0 +1,91 @@
+"""
+executor.py
+
+Runs CPU-bound retrieval (query encoding, scoring, re-ranking) on a
+dedicated, size-bounded thread pool so the event loop stays responsive.
+
+NumPy and the sentence-transformers encoder release the GIL for their heavy
+work, so threads give real parallelism without a per-process model copy.
+Work waiting for a free thread is capped; when the queue is full new work is
+rejected immediately, so overload shows up as a metric and a 503 instead of
+as added latency for every request.
+"""
+
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the retrieval queue is at capacity."""
+
+
+class RetrievalExecutor:
+    """Bounded thread pool with queue-depth and wait-time metrics."""
+
+    def __init__(self, max_workers: int, max_queue: int):
+        """
+        Args:
+            max_workers: Threads running retrieval concurrently
+            max_queue: Maximum tasks waiting for a free thread
+        """
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="retrieval")
+        self._lock = threading.Lock()
+
+        self.queued = 0
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool and await its result."""
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError(f"Retrieval queue full ({self.max_queue} waiting)")
+            self.queued += 1
+            self.submitted += 1
+        enqueued_at = time.perf_counter()
+
+        def task():
+            wait = time.perf_counter() - enqueued_at
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, task)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for the health endpoint."""
+        with self._lock:
+            started = self.submitted - self.queued
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self._total_wait / started * 1000, 2) if started else 0.0,
+                "max_wait_ms": round(self._max_wait * 1000, 2)
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
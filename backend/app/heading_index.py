@@ -0,0 +1,68 @@
+"""
+heading_index.py
+
+Inverted index from section-heading tokens to chunk indices.
+Used for the "heading contains a query term" boost.
+
+Headings are tokenized on whitespace, the same way query terms are. A query
+term (which never contains whitespace) is a substring of a heading exactly
+when it is a substring of one of the heading's tokens, so the index returns
+the same chunks as the original per-chunk substring check.
+"""
+
+import numpy as np
+from functools import lru_cache
+from typing import Dict, List, Sequence
+
+# Query terms must be longer than this to trigger a heading match
+MIN_TERM_LENGTH = 3
+
+EMPTY_POSTING = np.empty(0, dtype=np.int32)
+
+
+class HeadingIndex:
+    """Token -> chunk-id postings built once over lower-cased section headings."""
+
+    def __init__(self, headings: Sequence[str], term_cache_size: int = 4096):
+        """
+        Args:
+            headings: Lower-cased section heading for every chunk, in chunk order
+            term_cache_size: Number of query terms whose postings are memoized
+        """
+        token_chunks: Dict[str, List[int]] = {}
+        for chunk_id, heading in enumerate(headings):
+            for token in set(heading.split()):
+                token_chunks.setdefault(token, []).append(chunk_id)
+
+        self.postings: Dict[str, np.ndarray] = {
+            token: np.array(chunk_ids, dtype=np.int32)
+            for token, chunk_ids in token_chunks.items()
+        }
+        self.vocabulary: List[str] = list(self.postings)
+        self._term_chunks = lru_cache(maxsize=term_cache_size)(self._lookup_term)
+
+    def _lookup_term(self, term: str) -> np.ndarray:
+        """All chunks whose heading contains term as a substring."""
+        tokens = [token for token in self.vocabulary if term in token]
+        if not tokens:
+            return EMPTY_POSTING
+        if len(tokens) == 1:
+            return self.postings[tokens[0]]
+        return np.unique(np.concatenate([self.postings[t] for t in tokens]))
+
+    def query_terms(self, query_lower: str) -> List[str]:
+        """Query terms eligible for heading matching."""
+        return [t for t in query_lower.split() if len(t) > MIN_TERM_LENGTH]
+
+    def match(self, query_lower: str) -> np.ndarray:
+        """
+        Chunk indices whose heading contains any eligible query term.
+        Each chunk appears once, so the boost is only applied once per chunk.
+        """
+        terms = self.query_terms(query_lower)
+        if not terms:
+            return EMPTY_POSTING
+        matches = [self._term_chunks(term) for term in dict.fromkeys(terms)]
+        if len(matches) == 1:
+            return matches[0]
+        return np.unique(np.concatenate(matches))
@@ -245,21 +245,6 @@ KEY_SECTIONS = {
 }
 
 
-def get_key_sections_for_query(query: str) -> list:
-    """
-    Returns a list of (act_identifier, section_numbers) tuples
-    for sections that should be boosted for this query.
-    """
-    query_lower = query.lower()
-    matched_sections = []
-    
-    for topic, act_sections in KEY_SECTIONS.items():
-        if topic in query_lower:
-            matched_sections.extend(act_sections)
-    
-    return matched_sections
-
-
 def should_boost_section(meta: dict, key_sections: list) -> float:
     """
     Returns a boost multiplier (1.0 = no boost, >1.0 = boost).
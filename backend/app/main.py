@@ -12,19 +12,37 @@ Run from magna root:
 
 import os
 import json
+import hashlib
 import uuid
 import time
+import asyncio
 import numpy as np
 
-from .key_sections import get_key_sections_for_query, should_boost_section
+from .query_analysis import detect_act_from_query, get_key_sections_for_query
+from .boosting import BoostIndex
+from .metadata_store import MetadataStore
+from .cache import TTLCache, SemanticAnswerCache, normalize_query
+from .executor import RetrievalExecutor, QueueFullError
+from .batching import MicroBatcher
+from .analytics_writer import AnalyticsWriter
+from .retrieval import (
+    ActPartition,
+    CompactEmbeddings,
+    IVFIndex,
+    blockwise_dot,
+    global_indices,
+    select,
+    shortlist,
+    top_k_indices
+)
 from pathlib import Path
 from typing import List, Optional
-from datetime import datetime
 
 from fastapi import FastAPI, HTTPException, APIRouter, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
+from starlette.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
@@ -49,6 +67,52 @@ EMBEDDINGS_DIR = Path("data/embeddings")
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
 TOP_K = 5
 
+# Embeddings are memory-mapped read-only by default so workers share pages via
+# the OS page cache. Set EMBEDDINGS_IN_MEMORY=true to load a private copy instead.
+EMBEDDINGS_IN_MEMORY = os.getenv("EMBEDDINGS_IN_MEMORY", "false").lower() == "true"
+
+# Scan a compact int8/float16 copy (written by generate_embeddings.py --quantize)
+# to shortlist candidates, then re-score them exactly. "float32" disables it.
+EMBEDDINGS_PRECISION = os.getenv("EMBEDDINGS_PRECISION", "float32").lower()
+
+# Lists probed per unfiltered query with the IVF index from build_ann_index.py.
+# Off (0) by default; choose a value from the search recall report the script prints.
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "0"))
+
+# Query embedding cache (keyed on whitespace- and case-normalized query text)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+
+# Ranked /search results, keyed on (query, limit, act filter, corpus version)
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+
+# /chat answers reused for near-identical questions that retrieve the same chunks
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+# Claude API: shared keep-alive connection pool and in-flight request limit per worker
+CLAUDE_MAX_CONNECTIONS = int(os.getenv("CLAUDE_MAX_CONNECTIONS", "64"))
+CLAUDE_MAX_CONCURRENCY = int(os.getenv("CLAUDE_MAX_CONCURRENCY", "32"))
+
+# Retrieval thread pool: worker threads and searches allowed to wait for one
+# (also the limit on queries waiting for each encode/score batch)
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", str(min(4, os.cpu_count() or 1))))
+RETRIEVAL_QUEUE_SIZE = int(os.getenv("RETRIEVAL_QUEUE_SIZE", "64"))
+
+# Query encodes that arrive while an encode is running are batched into the next
+# encoder call, run as one retrieval pool job (batch size 1 disables)
+ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", "32"))
+
+# Full-corpus scans are batched the same way into one matrix-matrix product
+# (batch size 1 disables). Each batch holds a queries x chunks float32 score matrix.
+SCORE_BATCH_SIZE = int(os.getenv("SCORE_BATCH_SIZE", "8"))
+
+# Supabase logging is queued and bulk-written in the background
+ANALYTICS_FLUSH_INTERVAL_MS = float(os.getenv("ANALYTICS_FLUSH_INTERVAL_MS", "1000"))
+ANALYTICS_BATCH_ROWS = int(os.getenv("ANALYTICS_BATCH_ROWS", "200"))
+ANALYTICS_MAX_RETRIES = int(os.getenv("ANALYTICS_MAX_RETRIES", "3"))
+
 # Pydantic models
 class ChatRequest(BaseModel):
     message: str = Field(..., min_length=1, max_length=5000, description="User message")
@@ -111,9 +175,22 @@ app.add_middleware(SecurityHeadersMiddleware)
 # Global state
 embeddings = None
 metadata = None
+boost_index = None
+act_partition = None
+compact_embeddings = None
+ann_index = None
 embedding_model = None
+encode_batcher = None
+score_batcher = None
 anthropic_client = None
 supabase_client = None
+analytics_writer = None
+query_embedding_cache = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS)
+search_result_cache = TTLCache(SEARCH_CACHE_SIZE)
+answer_cache = SemanticAnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_THRESHOLD)
+corpus_version = None
+claude_semaphore = asyncio.Semaphore(CLAUDE_MAX_CONCURRENCY)
+retrieval_executor = RetrievalExecutor(RETRIEVAL_WORKERS, RETRIEVAL_QUEUE_SIZE)
 
 # System prompt
 SYSTEM_PROMPT = """You are Bowen, a chatbot legal information assistant for New Zealand legislation.
@@ -163,8 +240,8 @@ Always end responses by encouraging users to verify current legislation at legis
 DISCLAIMER = """⚠️ Bowen is a chatbot, not legal advice. It may be incomplete or outdated. For legal decisions, consult a qualified NZ lawyer or Community Law Centre."""
 
 
-# Import act detection from registry (single source of truth)
-from .acts_registry import detect_act_from_query, get_all_acts, ACTS_REGISTRY
+# Act registry (single source of truth)
+from .acts_registry import get_all_acts, ACTS_REGISTRY
 from .logger import logger, LogEvent
 from .errors import (
     raise_empty_message,
@@ -173,6 +250,7 @@ from .errors import (
     raise_model_not_loaded,
     raise_anthropic_unavailable,
     raise_generation_failed,
+    raise_server_overloaded,
     ErrorCode,
     InternalError
 )
@@ -181,7 +259,7 @@ from .errors import (
 @app.on_event("startup")
 async def startup():
     """Load models and data on startup."""
-    global embeddings, metadata, embedding_model, anthropic_client, supabase_client
+    global embeddings, metadata, boost_index, act_partition, compact_embeddings, ann_index, corpus_version, embedding_model, encode_batcher, score_batcher, anthropic_client, supabase_client, analytics_writer
 
     print("\n" + "=" * 50)
     print("Starting Bowen Backend...")
@@ -203,15 +281,82 @@ async def startup():
     # Load embeddings
     embeddings_path = EMBEDDINGS_DIR / "embeddings.npy"
     metadata_path = EMBEDDINGS_DIR / "metadata.json"
+    metadata_store_dir = EMBEDDINGS_DIR / "metadata_store"
+    has_metadata = MetadataStore.exists(metadata_store_dir) or metadata_path.exists()
     
-    if embeddings_path.exists() and metadata_path.exists():
-        print(f"\nLoading embeddings from {embeddings_path}...")
-        embeddings = np.load(embeddings_path, allow_pickle=True)
+    if embeddings_path.exists() and has_metadata:
+        load_mode = "in memory" if EMBEDDINGS_IN_MEMORY else "memory-mapped"
+        print(f"\nLoading embeddings from {embeddings_path} ({load_mode})...")
+        embeddings = np.load(
+            embeddings_path,
+            mmap_mode=None if EMBEDDINGS_IN_MEMORY else "r",
+            allow_pickle=False
+        )
         
-        with open(metadata_path, 'r') as f:
-            metadata = json.load(f)
+        # Prefer the memory-mapped columnar store; fall back to metadata.json
+        if MetadataStore.exists(metadata_store_dir):
+            print(f"Opening metadata store {metadata_store_dir}...")
+            metadata = MetadataStore(metadata_store_dir)
+        else:
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
         
         print(f"✓ Loaded {len(metadata):,} chunks")
+
+        # Identify this embeddings build; cached results from another build are dropped
+        config_path = EMBEDDINGS_DIR / "config.json"
+        build_config = {}
+        if config_path.exists():
+            with open(config_path, 'r') as f:
+                build_config = json.load(f)
+        loaded_version = build_config.get("generated_at") or str(embeddings_path.stat().st_mtime)
+        if loaded_version != corpus_version:
+            search_result_cache.clear()
+            answer_cache.clear()
+        corpus_version = loaded_version
+        print(f"✓ Corpus version: {corpus_version}")
+
+        # Precompute per-chunk boosting features
+        boost_index = BoostIndex(metadata)
+        act_partition = ActPartition(boost_index.act_codes, boost_index.act_keys)
+        print(f"✓ Boost index built ({len(act_partition.act_rows)} acts)")
+
+        if EMBEDDINGS_PRECISION in ("int8", "float16"):
+            compact_path = EMBEDDINGS_DIR / f"embeddings_{EMBEDDINGS_PRECISION}.npy"
+            scale_path = EMBEDDINGS_DIR / "embeddings_int8_scale.npy"
+            if not compact_path.exists():
+                print(f"⚠ {compact_path} not found, scoring full-precision embeddings only")
+            elif (build_config.get("quantized") or {}).get("dtype") != EMBEDDINGS_PRECISION:
+                print(f"⚠ {compact_path} is not part of this embeddings build, scoring full-precision embeddings only")
+            else:
+                compact = np.load(compact_path, mmap_mode="r", allow_pickle=False)
+                scale = np.load(scale_path, allow_pickle=False) if EMBEDDINGS_PRECISION == "int8" else None
+                if compact.shape != embeddings.shape or (scale is not None and scale.shape != embeddings.shape[1:]):
+                    print(f"⚠ {compact_path} has shape {compact.shape}, expected {embeddings.shape}; "
+                          f"scoring full-precision embeddings only")
+                else:
+                    compact_embeddings = CompactEmbeddings(compact, scale)
+                    print(f"✓ Loaded {EMBEDDINGS_PRECISION} embeddings for shortlisting")
+
+        ann_index_path = EMBEDDINGS_DIR / "ivf_index.npz"
+        if ANN_NPROBE > 0 and ann_index_path.exists():
+            index = IVFIndex.load(ann_index_path)
+            ann_config = build_config.get("ann_index") or {}
+            if (
+                ann_config.get("embeddings_generated_at") != build_config.get("generated_at")
+                or len(index.list_rows) != len(embeddings)
+                or (len(index.list_rows) and index.list_rows.max() >= len(embeddings))
+            ):
+                print(f"⚠ {ann_index_path} was built from other embeddings, searching exhaustively")
+                print("  Rebuild it with build_ann_index.py")
+            else:
+                ann_index = index
+                print(f"✓ Loaded IVF index ({ann_index.nlist:,} lists, nprobe={ANN_NPROBE})")
+
+        if SCORE_BATCH_SIZE > 1:
+            score_batcher = MicroBatcher(
+                score_queries, SCORE_BATCH_SIZE, run_retrieval, RETRIEVAL_QUEUE_SIZE, name="score-batcher"
+            )
     else:
         print(f"✗ Embeddings not found at {EMBEDDINGS_DIR}")
         print("  Run generate_embeddings.py first")
@@ -221,6 +366,10 @@ async def startup():
         from sentence_transformers import SentenceTransformer
         print(f"\nLoading embedding model: {EMBEDDING_MODEL}...")
         embedding_model = SentenceTransformer(EMBEDDING_MODEL)
+        if ENCODE_BATCH_SIZE > 1:
+            encode_batcher = MicroBatcher(
+                encode_queries, ENCODE_BATCH_SIZE, run_retrieval, RETRIEVAL_QUEUE_SIZE, name="encode-batcher"
+            )
         print("✓ Embedding model loaded")
     except Exception as e:
         print(f"✗ Could not load embedding model: {e}")
@@ -229,8 +378,15 @@ async def startup():
     if ANTHROPIC_API_KEY:
         try:
             import anthropic
-            anthropic_client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-            print("✓ Anthropic client initialized")
+            import httpx
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=CLAUDE_MAX_CONNECTIONS,
+                    max_keepalive_connections=CLAUDE_MAX_CONNECTIONS
+                )
+            )
+            anthropic_client = anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY, http_client=http_client)
+            print(f"✓ Anthropic client initialized (max {CLAUDE_MAX_CONCURRENCY} concurrent requests)")
         except Exception as e:
             print(f"✗ Could not initialize Anthropic: {e}")
     else:
@@ -240,6 +396,13 @@ async def startup():
     if SUPABASE_AVAILABLE and SUPABASE_URL and SUPABASE_ANON_KEY and not SUPABASE_URL.startswith("your-"):
         try:
             supabase_client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+            analytics_writer = AnalyticsWriter(
+                supabase_client,
+                flush_interval_seconds=ANALYTICS_FLUSH_INTERVAL_MS / 1000,
+                max_batch_rows=ANALYTICS_BATCH_ROWS,
+                max_retries=ANALYTICS_MAX_RETRIES
+            )
+            analytics_writer.start()
             print("✓ Supabase client initialized")
         except Exception as e:
             print(f"✗ Could not initialize Supabase: {e}")
@@ -251,83 +414,138 @@ async def startup():
     print("=" * 50 + "\n")
 
 
-def search_similar(query: str, top_k: int = TOP_K, act_filter: str = None) -> List[dict]:
+@app.on_event("shutdown")
+async def shutdown():
+    """Flush queued analytics and release pooled connections and the retrieval pool."""
+    if analytics_writer is not None:
+        await analytics_writer.close()
+    for batcher in (encode_batcher, score_batcher):
+        if batcher is not None:
+            await batcher.close()
+    if anthropic_client is not None:
+        await anthropic_client.close()
+    retrieval_executor.shutdown()
+    logger.info(LogEvent.SHUTDOWN, "Shutdown complete")
+
+
+def encode_queries(queries: List[str]) -> np.ndarray:
+    """Encode a batch of queries in one encoder call."""
+    return embedding_model.encode(queries, batch_size=len(queries), convert_to_numpy=True).astype(np.float32)
+
+
+def encode_query(query: str) -> np.ndarray:
+    """Encode a query, reusing the cached vector for repeated questions."""
+    key = normalize_query(query)
+    query_embedding = query_embedding_cache.get(key)
+    if query_embedding is None:
+        query_embedding = embedding_model.encode(query, convert_to_numpy=True).astype(np.float32)
+        query_embedding.setflags(write=False)
+        query_embedding_cache.set(key, query_embedding)
+    return query_embedding
+
+
+async def embed_query(query: str) -> np.ndarray:
+    """
+    encode_query for request handlers. Cache hits are answered on the event
+    loop; misses join the next encode batch, or are encoded on the retrieval
+    pool when batching is disabled.
+    """
+    if encode_batcher is None:
+        return await run_retrieval(encode_query, query)
+
+    key = normalize_query(query)
+    query_embedding = query_embedding_cache.get(key)
+    if query_embedding is None:
+        # A copy, so the cache does not keep the whole batch matrix alive
+        query_embedding = (await submit_batched(encode_batcher, query)).copy()
+        query_embedding.setflags(write=False)
+        query_embedding_cache.set(key, query_embedding)
+    return query_embedding
+
+
+def score_queries(query_embeddings: List[np.ndarray]) -> list:
+    """
+    Full-corpus scores for a batch of queries from one matrix-matrix product.
+    Returns (approx, error) per query when a compact copy is loaded,
+    otherwise the exact similarities.
+    """
+    stacked = np.stack(query_embeddings)
+    if compact_embeddings is not None:
+        approx, errors = compact_embeddings.batch_scores(stacked)
+        return [(scores, float(error)) for scores, error in zip(approx, errors)]
+    return list(blockwise_dot(embeddings, stacked))
+
+
+def scans_full_corpus(act_filter: Optional[str]) -> bool:
+    """Whether search_similar scores every chunk for this filter."""
+    return not act_filter and ann_index is None
+
+
+def search_similar(
+    query: str,
+    top_k: int = TOP_K,
+    act_filter: str = None,
+    query_embedding: Optional[np.ndarray] = None,
+    corpus_scores=None
+) -> List[dict]:
     """
     Search for similar chunks with:
     - Optional act filtering
     - Keyword boosting for overview questions
     - KEY SECTION boosting for common topics
+
+    corpus_scores is this query's score_queries result, for full-corpus scans
+    already scored in a batch.
     """
     if embeddings is None or embedding_model is None:
         return []
 
-    # Encode query
-    query_embedding = embedding_model.encode(query, convert_to_numpy=True)
-
-    # Calculate cosine similarities
-    similarities = np.dot(embeddings, query_embedding).copy()
+    # Encode query (unless the caller already has its embedding)
+    if query_embedding is None:
+        query_embedding = encode_query(query)
 
-    query_lower = query.lower()
-
-    # Get key sections for this query
     key_sections = get_key_sections_for_query(query)
 
-    # Keyword boosting for "what is" questions
-    boost_terms = ['purpose', 'interpretation', 'application', 'object', 'principle', 'definition']
-    is_overview_question = any(q in query_lower for q in ['what is', 'what are', 'explain', 'overview', 'purpose of'])
-
-    for i, meta in enumerate(metadata):
-        text_lower = meta.get('text', '').lower()
-        heading_lower = meta.get('section_heading', '').lower()
-        section_num = meta.get('section_number', '').strip()
-
-        # Apply key section boosting
-        section_boost = should_boost_section(meta, key_sections)
-        if section_boost > 1.0:
-            similarities[i] *= section_boost
-
-        # Boost purpose/interpretation sections for overview questions
-        if is_overview_question:
-            for term in boost_terms:
-                if term in heading_lower or term in text_lower[:200]:
-                    similarities[i] *= 1.3  # 30% boost
-
-            # Boost early sections (usually purpose/interpretation)
-            if section_num.isdigit() and int(section_num) <= 10:
-                similarities[i] *= 1.2  # 20% boost
-
-        # Boost chunks with actual section numbers
-        # Prefer chunks that have section numbers over general text
-        if section_num and section_num.replace('.', '').isdigit():
-            similarities[i] *= 1.1  # 10% boost for having a section number
-
-        # Boost chunks where section heading matches query terms
-        # If the query mentions "bond" and the heading contains "bond", boost it
-        query_terms = [t for t in query_lower.split() if len(t) > 3]
-        for term in query_terms:
-            if term in heading_lower:
-                similarities[i] *= 1.4  # 40% boost for heading match
-                break  # Only boost once per chunk
-
-    # Apply act filter if specified
+    # Restrict scoring to the detected act's rows if specified; otherwise to
+    # the nearest IVF lists plus the key sections, which can outrank them
     if act_filter:
-        act_filter_lower = act_filter.lower()
-        for i, meta in enumerate(metadata):
-            act_title = meta.get('act_title', '').lower()
-            act_short = meta.get('act_short_name', '').lower()
-            if act_filter_lower not in act_title and act_filter_lower not in act_short:
-                similarities[i] = -1  # Exclude non-matching acts
+        rows = act_partition.rows_for_filter(act_filter)
+    elif ann_index is not None:
+        rows = np.union1d(
+            ann_index.candidate_rows(query_embedding, ANN_NPROBE),
+            boost_index.key_section_rows(key_sections)
+        )
+    else:
+        rows = None
 
-    # Get top-k indices
-    top_indices = np.argsort(similarities)[-top_k:][::-1]
+    # Key section, overview and heading boosts for the scored rows
+    multipliers = boost_index.multipliers(query, key_sections, rows)
 
-    # Filter out negative scores (excluded by act filter)
-    top_indices = [i for i in top_indices if similarities[i] > 0]
+    if compact_embeddings is not None:
+        # Shortlist on the compact copy, then re-score the shortlist exactly
+        if rows is None and corpus_scores is not None:
+            approx, error = corpus_scores
+        else:
+            approx, error = compact_embeddings.scores(query_embedding, rows)
+        candidates = shortlist(approx, error, multipliers, top_k)
+        candidate_indices = global_indices(rows, candidates)
+        similarities = np.dot(embeddings[candidate_indices], query_embedding) * multipliers[candidates]
+        top_local = top_k_indices(similarities, top_k, min_score=0)
+        top_indices = candidate_indices[top_local]
+    else:
+        # Calculate cosine similarities and take the top-k, dropping non-positive scores
+        if rows is None and corpus_scores is not None:
+            similarities = corpus_scores * multipliers
+        else:
+            similarities = np.dot(select(embeddings, rows), query_embedding) * multipliers
+        top_local = top_k_indices(similarities, top_k, min_score=0)
+        top_indices = global_indices(rows, top_local)
 
     results = []
-    for idx in top_indices:
+    for local, idx in zip(top_local, top_indices):
         meta = metadata[idx]
         results.append({
+            "chunk_id": int(idx),
             "text": meta.get("text", ""),
             "act_title": meta.get("act_title", ""),
             "act_short_name": meta.get("act_short_name", ""),
@@ -335,12 +553,67 @@ def search_similar(query: str, top_k: int = TOP_K, act_filter: str = None) -> Li
             "section_heading": meta.get("section_heading", ""),
             "section_url": meta.get("section_url", ""),
             "act_url": meta.get("act_url", ""),
-            "score": float(similarities[idx])
+            "score": float(similarities[local])
         })
 
     return results
 
 
+async def run_retrieval(fn, *args, **kwargs):
+    """Run fn on the retrieval pool, answering 503 when it is saturated."""
+    try:
+        return await retrieval_executor.run(fn, *args, **kwargs)
+    except QueueFullError:
+        raise_server_overloaded()
+
+
+async def submit_batched(batcher: MicroBatcher, item):
+    """Add item to the batcher's next batch, answering 503 when too many are waiting."""
+    try:
+        return await batcher.submit(item)
+    except QueueFullError:
+        raise_server_overloaded()
+
+
+async def run_search(
+    query: str,
+    top_k: int = TOP_K,
+    act_filter: str = None,
+    query_embedding: Optional[np.ndarray] = None
+) -> List[dict]:
+    """
+    Run search_similar on the retrieval pool. The query encode and, for
+    full-corpus scans, the scoring are batched with concurrent requests first.
+    """
+    if query_embedding is None:
+        query_embedding = await embed_query(query)
+    corpus_scores = None
+    if score_batcher is not None and scans_full_corpus(act_filter):
+        corpus_scores = await submit_batched(score_batcher, query_embedding)
+    return await run_retrieval(
+        search_similar,
+        query,
+        top_k=top_k,
+        act_filter=act_filter,
+        query_embedding=query_embedding,
+        corpus_scores=corpus_scores
+    )
+
+
+async def cached_search(query: str, top_k: int = TOP_K, act_filter: str = None) -> List[dict]:
+    """
+    run_search behind the result cache.
+    Ranking only depends on the lower-cased query, so that is the cache key.
+    Hits are answered on the event loop without queueing for the pool.
+    """
+    key = (query.lower(), top_k, act_filter, corpus_version)
+    results = search_result_cache.get(key)
+    if results is None:
+        results = await run_search(query, top_k=top_k, act_filter=act_filter)
+        search_result_cache.set(key, results)
+    return results
+
+
 def build_context(results: List[dict]) -> str:
     """Build context string with better organization."""
     if not results:
@@ -370,34 +643,78 @@ def build_context(results: List[dict]) -> str:
     return "\n---\n\n".join(parts)
 
 
-async def generate_response(query: str, context: str) -> str:
-    """Generate response using Claude with hybrid knowledge approach."""
-    if not anthropic_client:
-        raise_anthropic_unavailable()
+# Fixed answering instructions. Sent with SYSTEM_PROMPT as the cached prompt prefix.
+ANSWER_INSTRUCTIONS = """Each question is followed by LEGISLATION EXCERPTS FROM DATABASE. Please answer the question using:
+1. Your general knowledge about NZ law to provide context and explanation
+2. The specific excerpts to cite exact provisions and wording
 
-    try:
-        message = anthropic_client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1500,  # Increased for fuller responses
-            system=SYSTEM_PROMPT,
-            messages=[{
-                "role": "user",
-                "content": f"""Question: {query}
+If the excerpts don't contain the specific information needed, use your general knowledge but make clear what comes from the excerpts vs your training.
+
+Remember: Provide information, not legal advice. Cite specific sections where possible."""
+
+# Cached answers are only reused with the prompt they were generated from
+PROMPT_VERSION = hashlib.sha256(f"{SYSTEM_PROMPT}\n{ANSWER_INSTRUCTIONS}".encode("utf-8")).hexdigest()[:16]
+
+# Token usage reported by the Claude API, including prompt-cache reads and writes
+USAGE_FIELDS = ["input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"]
+claude_usage = {"requests": 0, **{field: 0 for field in USAGE_FIELDS}}
+
+
+def build_claude_request(query: str, context: str) -> dict:
+    """
+    Arguments for messages.create / messages.stream.
+
+    The system prompt and instructions are identical on every call and are
+    marked for prompt caching; only the question and excerpts vary.
+    """
+    return {
+        "model": "claude-sonnet-4-20250514",
+        "max_tokens": 1500,  # Increased for fuller responses
+        "system": [
+            {"type": "text", "text": SYSTEM_PROMPT},
+            {"type": "text", "text": ANSWER_INSTRUCTIONS, "cache_control": {"type": "ephemeral"}}
+        ],
+        "messages": [{
+            "role": "user",
+            "content": f"""Question: {query}
 
 LEGISLATION EXCERPTS FROM DATABASE:
-{context}
+{context}"""
+        }]
+    }
 
----
 
-Please answer the question using:
-1. Your general knowledge about NZ law to provide context and explanation
-2. The specific excerpts above to cite exact provisions and wording
+def record_claude_usage(usage):
+    """Add the token usage of one Claude response to the running totals."""
+    if usage is None:
+        return
+    claude_usage["requests"] += 1
+    for field in USAGE_FIELDS:
+        claude_usage[field] += getattr(usage, field, None) or 0
 
-If the excerpts don't contain the specific information needed, use your general knowledge but make clear what comes from the excerpts vs your training.
 
-Remember: Provide information, not legal advice. Cite specific sections where possible."""
-            }]
-        )
+def claude_usage_stats() -> dict:
+    """Token totals plus the share of prompt tokens served from the prompt cache."""
+    prompt_tokens = (
+        claude_usage["input_tokens"]
+        + claude_usage["cache_read_input_tokens"]
+        + claude_usage["cache_creation_input_tokens"]
+    )
+    return {
+        **claude_usage,
+        "cache_read_share": round(claude_usage["cache_read_input_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0
+    }
+
+
+async def generate_response(query: str, context: str) -> str:
+    """Generate response using Claude with hybrid knowledge approach."""
+    if not anthropic_client:
+        raise_anthropic_unavailable()
+
+    try:
+        async with claude_semaphore:
+            message = await anthropic_client.messages.create(**build_claude_request(query, context))
+        record_claude_usage(getattr(message, "usage", None))
         return message.content[0].text
     except Exception as e:
         logger.error(LogEvent.CLAUDE_ERROR, f"Claude API error: {e}", error=e)
@@ -405,21 +722,17 @@ Remember: Provide information, not legal advice. Cite specific sections where po
 
 
 async def log_chat_message(session_id: str, role: str, content: str, sources: List[dict] = None):
-    """Log a chat message to Supabase."""
-    if not supabase_client:
+    """Queue a chat message for Supabase."""
+    if not analytics_writer:
         logger.warning(LogEvent.ANALYTICS_FAILURE, "Supabase not configured, skipping chat message log")
         return
 
-    try:
-        supabase_client.table("chat_messages").insert({
-            "session_id": session_id,
-            "role": role,
-            "content": content,
-            "sources": sources
-        }).execute()
-        logger.track_analytics_success("chat_message", session_id)
-    except Exception as e:
-        logger.track_analytics_failure("chat_message", e, session_id)
+    analytics_writer.enqueue("chat_messages", {
+        "session_id": session_id,
+        "role": role,
+        "content": content,
+        "sources": sources
+    })
 
 
 async def log_analytics(
@@ -430,55 +743,30 @@ async def log_analytics(
     sources_count: int = None,
     response_time_ms: int = None
 ):
-    """Log analytics event to Supabase."""
-    if not supabase_client:
+    """Queue an analytics event for Supabase."""
+    if not analytics_writer:
         logger.warning(LogEvent.ANALYTICS_FAILURE, "Supabase not configured, skipping analytics log")
         return
 
-    try:
-        supabase_client.table("analytics").insert({
-            "event_type": event_type,
-            "session_id": session_id,
-            "query": query,
-            "detected_act": detected_act,
-            "sources_count": sources_count,
-            "response_time_ms": response_time_ms
-        }).execute()
-        logger.track_analytics_success("analytics_event", session_id)
-    except Exception as e:
-        logger.track_analytics_failure("analytics_event", e, session_id)
+    analytics_writer.enqueue("analytics", {
+        "event_type": event_type,
+        "session_id": session_id,
+        "query": query,
+        "detected_act": detected_act,
+        "sources_count": sources_count,
+        "response_time_ms": response_time_ms
+    })
 
 
 async def update_topic_stats(act_name: str):
-    """Update topic statistics in Supabase."""
-    if not supabase_client or not act_name:
+    """Count a query about an act; counts are flushed to Supabase in batches."""
+    if not analytics_writer or not act_name:
         if not act_name:
             return  # No act detected, nothing to log
         logger.warning(LogEvent.ANALYTICS_FAILURE, "Supabase not configured, skipping topic stats")
         return
 
-    try:
-        # Try to upsert the topic stats
-        supabase_client.table("topic_stats").upsert({
-            "act_name": act_name,
-            "query_count": 1,
-            "last_queried": datetime.utcnow().isoformat()
-        }, on_conflict="act_name").execute()
-
-        # Increment the count
-        supabase_client.rpc("increment_topic_count", {"act": act_name}).execute()
-        logger.track_analytics_success("topic_stats")
-    except Exception as e:
-        # Fallback: just insert if RPC doesn't exist
-        try:
-            supabase_client.table("topic_stats").upsert({
-                "act_name": act_name,
-                "query_count": 1,
-                "last_queried": datetime.utcnow().isoformat()
-            }, on_conflict="act_name").execute()
-            logger.track_analytics_success("topic_stats_fallback")
-        except Exception as fallback_error:
-            logger.track_analytics_failure("topic_stats", fallback_error)
+    analytics_writer.count_topic(act_name)
 
 
 @app.get("/")
@@ -497,25 +785,29 @@ async def health():
     return {
         "status": "healthy",
         "embeddings_loaded": embeddings is not None,
+        "embeddings_memory_mapped": isinstance(embeddings, np.memmap),
+        "embeddings_precision": compact_embeddings.dtype if compact_embeddings is not None else "float32",
+        "ann_index": {"lists": ann_index.nlist, "nprobe": ANN_NPROBE} if ann_index is not None else None,
         "model_loaded": embedding_model is not None,
         "anthropic_ready": anthropic_client is not None,
         "supabase_ready": supabase_client is not None,
         "chunks": len(metadata) if metadata else 0,
+        "corpus_version": corpus_version,
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "search_result_cache": search_result_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "claude_usage": claude_usage_stats(),
+        "retrieval_executor": retrieval_executor.stats(),
+        "encode_batching": encode_batcher.stats() if encode_batcher is not None else None,
+        "score_batching": score_batcher.stats() if score_batcher is not None else None,
+        "analytics_writer": analytics_writer.stats() if analytics_writer is not None else None,
         "analytics_failures": failure_counts,
         "has_failures": len(failure_counts) > 0
     }
 
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    """Main chat endpoint with improved retrieval."""
-    start_time = time.time()
-    query = request.message.strip()
-
-    if not query:
-        raise_empty_message()
-
-    # Check service availability
+def check_chat_services():
+    """Raise a 503 if anything the chat endpoints need is not ready."""
     if embeddings is None or metadata is None:
         raise_embeddings_not_loaded()
 
@@ -525,29 +817,23 @@ async def chat(request: ChatRequest):
     if anthropic_client is None:
         raise_anthropic_unavailable()
 
-    # Get or generate session ID
-    session_id = request.session_id or str(uuid.uuid4())
-
-    # Detect if asking about specific Act
-    detected_act = detect_act_from_query(query)
-
-    # Log incoming request
-    logger.log_chat_request(session_id, len(query), detected_act)
 
-    # Search with optional act filter and increased results
-    results = search_similar(
-        query,
-        top_k=10,  # Increased from 5
-        act_filter=detected_act
-    )
-
-    # Build context
-    context = build_context(results)
+def normalize_session_id(session_id: Optional[str]) -> str:
+    """
+    The request's session ID as a UUID string (Supabase stores it in UUID
+    columns), or a new one. Other strings map to a stable name-based UUID,
+    so a client's messages stay grouped under one session.
+    """
+    if not session_id:
+        return str(uuid.uuid4())
+    try:
+        return str(uuid.UUID(session_id))
+    except ValueError:
+        return str(uuid.uuid5(uuid.NAMESPACE_OID, session_id))
 
-    # Generate response
-    response_text = await generate_response(query, context)
 
-    # Format sources (deduplicate by act+section, or by text hash if no section)
+def format_sources(results: List[dict]) -> List[Source]:
+    """Format sources (deduplicate by act+section, or by text hash if no section)."""
     sources = []
     seen = set()
     for r in results:
@@ -571,11 +857,18 @@ async def chat(request: ChatRequest):
                 excerpt=r['text'][:200] + "..." if len(r['text']) > 200 else r['text'],
                 score=r['score']
             ))
+    return sources
 
-    # Calculate response time
-    response_time_ms = int((time.time() - start_time) * 1000)
 
-    # Log to Supabase (non-blocking)
+async def log_chat_exchange(
+    session_id: str,
+    query: str,
+    response_text: str,
+    sources: List[Source],
+    detected_act: Optional[str],
+    response_time_ms: int
+):
+    """Queue a completed question/answer exchange for Supabase and log it."""
     sources_for_log = [{"act": s.act_title, "section": s.section_number} for s in sources[:5]]
     await log_chat_message(session_id, "user", query)
     await log_chat_message(session_id, "assistant", response_text, sources_for_log)
@@ -592,6 +885,57 @@ async def chat(request: ChatRequest):
     # Log response metrics
     logger.log_chat_response(session_id, response_time_ms, len(sources), success=True)
 
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    """Main chat endpoint with improved retrieval."""
+    start_time = time.time()
+    query = request.message.strip()
+
+    if not query:
+        raise_empty_message()
+
+    # Check service availability
+    check_chat_services()
+
+    # Get or generate session ID
+    session_id = normalize_session_id(request.session_id)
+
+    # Detect if asking about specific Act
+    detected_act = detect_act_from_query(query)
+
+    # Log incoming request
+    logger.log_chat_request(session_id, len(query), detected_act)
+
+    # Search with optional act filter and increased results
+    query_embedding = await embed_query(query)
+    results = await run_search(
+        query,
+        top_k=10,  # Increased from 5
+        act_filter=detected_act,
+        query_embedding=query_embedding
+    )
+
+    # Reuse the answer to a near-identical question over the same excerpts
+    answer_group = (corpus_version, PROMPT_VERSION, frozenset(r["chunk_id"] for r in results))
+    response_text = answer_cache.get(answer_group, query_embedding)
+
+    if response_text is None:
+        # Build context
+        context = build_context(results)
+
+        # Generate response
+        response_text = await generate_response(query, context)
+        answer_cache.set(answer_group, query, query_embedding, response_text)
+
+    sources = format_sources(results)
+
+    # Calculate response time
+    response_time_ms = int((time.time() - start_time) * 1000)
+
+    # Log to Supabase
+    await log_chat_exchange(session_id, query, response_text, sources, detected_act, response_time_ms)
+
     return ChatResponse(
         response=response_text,
         sources=sources[:5],  # Limit to top 5 sources
@@ -608,7 +952,7 @@ async def search(
     if embeddings is None or embedding_model is None:
         raise_embeddings_not_loaded()
 
-    results = search_similar(q, top_k=limit)
+    results = await cached_search(q, top_k=limit)
     
     return {
         "query": q,
@@ -648,6 +992,91 @@ async def v1_chat(request: ChatRequest):
     return await chat(request)
 
 
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@api_v1.post("/chat/stream")
+async def v1_chat_stream(request: ChatRequest):
+    """
+    Chat endpoint streamed as Server-Sent Events (v1).
+
+    Events, in order:
+        sources  Retrieved sources, sent as soon as retrieval finishes
+        delta    Claude text as it is generated ({"text": ...})
+        done     Disclaimer and timing metadata
+    An error event replaces delta/done if generation fails. The exchange is
+    logged to Supabase after the stream closes.
+    """
+    start_time = time.time()
+    query = request.message.strip()
+
+    if not query:
+        raise_empty_message()
+
+    check_chat_services()
+
+    session_id = normalize_session_id(request.session_id)
+    detected_act = detect_act_from_query(query)
+    logger.log_chat_request(session_id, len(query), detected_act)
+
+    results = await run_search(query, top_k=10, act_filter=detected_act)
+    sources = format_sources(results)
+    context = build_context(results)
+    retrieval_ms = int((time.time() - start_time) * 1000)
+
+    exchange = {"response_parts": [], "completed": False, "response_time_ms": 0}
+
+    async def event_stream():
+        yield sse_event("sources", {
+            "session_id": session_id,
+            "sources": [s.model_dump() for s in sources[:5]]
+        })
+
+        try:
+            async with claude_semaphore:
+                async with anthropic_client.messages.stream(**build_claude_request(query, context)) as stream:
+                    async for text in stream.text_stream:
+                        exchange["response_parts"].append(text)
+                        yield sse_event("delta", {"text": text})
+                    record_claude_usage(getattr(await stream.get_final_message(), "usage", None))
+        except Exception as e:
+            logger.error(LogEvent.CLAUDE_ERROR, f"Claude API error: {e}", error=e)
+            yield sse_event("error", {
+                "error": "Failed to generate response",
+                "code": ErrorCode.GENERATION_FAILED.value
+            })
+            return
+
+        exchange["completed"] = True
+        exchange["response_time_ms"] = int((time.time() - start_time) * 1000)
+        yield sse_event("done", {
+            "disclaimer": DISCLAIMER,
+            "timing": {
+                "retrieval_ms": retrieval_ms,
+                "total_ms": exchange["response_time_ms"]
+            }
+        })
+
+    async def log_after_stream():
+        if exchange["completed"]:
+            await log_chat_exchange(
+                session_id, query, "".join(exchange["response_parts"]),
+                sources, detected_act, exchange["response_time_ms"]
+            )
+        else:
+            response_time_ms = int((time.time() - start_time) * 1000)
+            logger.log_chat_response(session_id, response_time_ms, len(sources), success=False)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(log_after_stream)
+    )
+
+
 @api_v1.get("/search")
 async def v1_search(
     q: str = Query(..., min_length=1, max_length=1000, description="Search query"),
@@ -672,6 +1101,7 @@ async def v1_version():
         "endpoints": [
             "/api/v1/health",
             "/api/v1/chat",
+            "/api/v1/chat/stream",
             "/api/v1/search",
             "/api/v1/acts",
             "/api/v1/version"
@@ -704,7 +1134,7 @@ async def debug_search(q: str, limit: int = Query(default=10, ge=1, le=50)):
     key_sections = get_key_sections_for_query(q)
     detected_act = detect_act_from_query(q)
 
-    results = search_similar(q, top_k=limit, act_filter=detected_act)
+    results = await cached_search(q, top_k=limit, act_filter=detected_act)
 
     return {
         "query": q,
@@ -0,0 +1,110 @@
+"""
+metadata_store.py
+
+Read-only access to the columnar chunk metadata written by
+generate_embeddings.py (data/embeddings/metadata_store/).
+
+Layout:
+    manifest.json            Row count, column names and format version
+    acts.json                Act table: act_title, act_short_name, act_url
+    act_id.npy               int16 act table index per chunk
+    section_ordinal.npy      int32 numeric section number per chunk (-1 if not numeric)
+    <column>.bin             UTF-8 values of a string column, concatenated
+    <column>.offsets.npy     int64 start offset of each value (length rows + 1)
+
+Every file is memory-mapped, so loading is near-instant and Python strings
+are only built for the rows that are actually returned.
+"""
+
+import json
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+ACTS_FILE = "acts.json"
+
+# Per-chunk string columns stored as offset-indexed blobs
+STRING_COLUMNS = ["id", "text", "section_number", "section_heading", "section_url"]
+
+
+class StringColumn:
+    """A memory-mapped column of UTF-8 strings."""
+
+    def __init__(self, blob_path: Path, offsets_path: Path):
+        self.offsets = np.load(offsets_path, mmap_mode="r", allow_pickle=False)
+        # np.memmap cannot map an empty file
+        if blob_path.stat().st_size:
+            self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            self.blob = np.empty(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        return self.prefixes()
+
+    def prefixes(self, chars: Optional[int] = None) -> Iterator[str]:
+        """
+        Every value in row order, or only its first chars characters
+        (decoding at most 4 bytes per character of each row).
+        """
+        offsets = self.offsets.tolist()
+        blob = memoryview(self.blob)
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            if chars is None:
+                yield str(blob[start:end], "utf-8")
+            else:
+                # A character cut off at the byte limit lies past the first chars characters
+                yield str(blob[start:min(end, start + 4 * chars)], "utf-8", errors="ignore")[:chars]
+
+
+class MetadataStore:
+    """
+    Columnar chunk metadata.
+
+    Indexing a row returns the same dict as an entry of metadata.json, so the
+    store can be used wherever the JSON metadata list was.
+    """
+
+    def __init__(self, store_dir: Path):
+        with open(store_dir / MANIFEST_FILE, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported metadata store version: {manifest.get('format_version')}")
+
+        with open(store_dir / ACTS_FILE, "r", encoding="utf-8") as f:
+            self.acts: List[Dict[str, str]] = json.load(f)
+
+        self.rows = manifest["rows"]
+        self.act_id = np.load(store_dir / "act_id.npy", mmap_mode="r", allow_pickle=False)
+        self.section_ordinal = np.load(store_dir / "section_ordinal.npy", mmap_mode="r", allow_pickle=False)
+        self.columns: Dict[str, StringColumn] = {
+            name: StringColumn(store_dir / f"{name}.bin", store_dir / f"{name}.offsets.npy")
+            for name in STRING_COLUMNS
+        }
+
+    @staticmethod
+    def exists(store_dir: Path) -> bool:
+        return (store_dir / MANIFEST_FILE).exists()
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __getitem__(self, i: int) -> dict:
+        i = int(i)
+        if not 0 <= i < self.rows:
+            raise IndexError(i)
+        row = {name: column[i] for name, column in self.columns.items()}
+        row.update(self.acts[self.act_id[i]])
+        return row
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(self.rows):
+            yield self[i]
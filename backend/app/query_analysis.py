@@ -0,0 +1,136 @@
+"""
+query_analysis.py
+
+Single-pass query analysis for act detection and key-section topics.
+
+Every ACTS_REGISTRY keyword and KEY_SECTIONS topic is compiled into one
+Aho-Corasick automaton when the module is first imported, so a query is
+scanned once for all of them regardless of how many acts and topics are
+registered. Results are memoized per lower-cased query.
+
+Matching follows the original substring rules: the detected act is the
+first registry entry (in registry order) with a keyword in the query, and
+key sections are listed in KEY_SECTIONS order.
+
+detect_act_from_query and get_key_sections_for_query are the entry points
+used by the backend.
+"""
+
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from .acts_registry import ACTS_REGISTRY
+from .key_sections import KEY_SECTIONS
+
+ANALYSIS_CACHE_SIZE = 4096
+
+
+class PatternMatcher:
+    """Aho-Corasick automaton reporting every pattern that occurs in a text."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+
+        for pattern_id, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append(pattern_id)
+
+        # Breadth-first: failure links point to the longest proper suffix in the trie
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def find(self, text: str) -> Set[int]:
+        """Ids of all patterns occurring in text."""
+        found = set(self.output[0])
+        state = 0
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if self.output[state]:
+                found.update(self.output[state])
+        return found
+
+
+class QueryAnalysis(NamedTuple):
+    detected_act: Optional[str]
+    key_sections: Tuple[tuple, ...]
+
+
+def _act_base_name(title: str) -> str:
+    # Base name used for act filtering, e.g. "Residential Tenancies"
+    return title.rsplit(" Act", 1)[0] if " Act" in title else title
+
+
+# Pattern payloads: ("act", registry position) or ("topic", KEY_SECTIONS position)
+_act_base_names = [_act_base_name(info["title"]) for info in ACTS_REGISTRY.values()]
+_topic_sections = list(KEY_SECTIONS.values())
+_payloads: List[Tuple[str, int]] = []
+_patterns: List[str] = []
+for _position, _info in enumerate(ACTS_REGISTRY.values()):
+    for _keyword in _info["keywords"]:
+        _patterns.append(_keyword)
+        _payloads.append(("act", _position))
+for _position, _topic in enumerate(KEY_SECTIONS):
+    _patterns.append(_topic)
+    _payloads.append(("topic", _position))
+
+_matcher = PatternMatcher(_patterns)
+
+
+@lru_cache(maxsize=ANALYSIS_CACHE_SIZE)
+def _analyze(query_lower: str) -> QueryAnalysis:
+    acts = set()
+    topics = set()
+    for pattern_id in _matcher.find(query_lower):
+        kind, position = _payloads[pattern_id]
+        (acts if kind == "act" else topics).add(position)
+
+    detected_act = _act_base_names[min(acts)] if acts else None
+    key_sections = tuple(
+        section
+        for position in sorted(topics)
+        for section in _topic_sections[position]
+    )
+    return QueryAnalysis(detected_act, key_sections)
+
+
+def analyze_query(query: str) -> QueryAnalysis:
+    """Detected act and key sections for a query, from one scan of its text."""
+    return _analyze(query.lower())
+
+
+def detect_act_from_query(query: str) -> Optional[str]:
+    """
+    Detect if user is asking about a specific Act using the registry.
+
+    Returns the base name used for filtering (e.g., "Residential Tenancies")
+    of the first registry entry with a keyword in the query.
+    """
+    return analyze_query(query).detected_act
+
+
+def get_key_sections_for_query(query: str) -> list:
+    """
+    Returns a list of (act_identifier, section_numbers) tuples
+    for sections that should be boosted for this query.
+    """
+    return list(analyze_query(query).key_sections)
@@ -0,0 +1,265 @@
+"""
+retrieval.py
+
+Helpers for scoring the embedding matrix: row selections, top-k selection,
+the compact (int8 / float16) copy used to shortlist candidates and the IVF
+index built by build_ann_index.py.
+
+A row selection is either None (every chunk), a slice of contiguous rows,
+or a sorted array of chunk indices.
+"""
+
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+RowSelection = Optional[Union[slice, np.ndarray]]
+
+# Rows converted to float32 at a time when scoring a compact matrix
+BLOCK_ROWS = 8192
+
+# Slack added to quantization error bounds for float32 rounding in the dot product
+ROUNDING_SLACK = 1e-4
+
+
+def select(array: np.ndarray, rows: RowSelection) -> np.ndarray:
+    """Rows of array for a selection (a view when rows is None or a slice)."""
+    if rows is None:
+        return array
+    return array[rows]
+
+
+def global_indices(rows: RowSelection, local: np.ndarray) -> np.ndarray:
+    """Map positions within a selection back to chunk indices."""
+    if rows is None:
+        return local
+    if isinstance(rows, slice):
+        return local + rows.start
+    return rows[local]
+
+
+def local_positions(rows: RowSelection, chunk_ids: np.ndarray) -> np.ndarray:
+    """Positions within a selection of those chunk ids that fall inside it."""
+    if rows is None:
+        return chunk_ids
+    if isinstance(rows, slice):
+        inside = (chunk_ids >= rows.start) & (chunk_ids < rows.stop)
+        return chunk_ids[inside] - rows.start
+    positions = np.searchsorted(rows, chunk_ids)
+    positions = np.minimum(positions, len(rows) - 1)
+    return positions[rows[positions] == chunk_ids] if len(rows) else positions[:0]
+
+
+def top_k_indices(scores: np.ndarray, k: int, min_score: Optional[float] = None) -> np.ndarray:
+    """
+    Positions of the k highest scores, best first.
+
+    Uses argpartition plus a sort of the k candidates instead of sorting every
+    score. Ties are broken by position (lower chunk index first), including
+    ties at the k-th place, so results are reproducible between runs.
+
+    Args:
+        scores: Score per candidate
+        k: Number of results wanted
+        min_score: If given, only scores strictly greater than this are kept
+    """
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if k < n:
+        # Everything tied with the k-th best score stays a candidate
+        kth_best = scores[np.argpartition(scores, n - k)[n - k:]].min()
+        candidates = np.flatnonzero(scores >= kth_best)
+    else:
+        candidates = np.arange(n)
+
+    if min_score is not None:
+        candidates = candidates[scores[candidates] > min_score]
+
+    order = np.lexsort((candidates, -scores[candidates]))[:k]
+    return candidates[order]
+
+
+def blockwise_dot(matrix: np.ndarray, vector: np.ndarray) -> np.ndarray:
+    """
+    matrix @ vector in float32, converting BLOCK_ROWS rows at a time.
+    Keeps the float32 copy of a compact matrix cache-sized instead of
+    materialising all of it.
+
+    vector may also be a (queries, dim) stack, giving a (queries, rows) score
+    matrix from one matrix-matrix product, so the embedding matrix is read
+    from memory once for all of them.
+    """
+    if vector.ndim == 2:
+        if matrix.dtype == np.float32:
+            return np.dot(vector, matrix.T)
+        out = np.empty((len(vector), len(matrix)), dtype=np.float32)
+        for start in range(0, len(matrix), BLOCK_ROWS):
+            block = matrix[start:start + BLOCK_ROWS]
+            out[:, start:start + len(block)] = np.dot(vector, block.astype(np.float32).T)
+        return out
+    if matrix.dtype == np.float32:
+        return np.dot(matrix, vector)
+    out = np.empty(len(matrix), dtype=np.float32)
+    for start in range(0, len(matrix), BLOCK_ROWS):
+        block = matrix[start:start + BLOCK_ROWS]
+        out[start:start + len(block)] = np.dot(block.astype(np.float32), vector)
+    return out
+
+
+class CompactEmbeddings:
+    """
+    Reduced-precision copy of the embedding matrix.
+
+    int8 rows are stored with a float32 scale per dimension
+    (value ~= int8 * scale); float16 rows are stored as-is. scores() returns
+    approximate similarities together with a bound on their error, which
+    shortlist() uses to pick every row that could make the exact top-k.
+    """
+
+    def __init__(self, matrix: np.ndarray, scale: Optional[np.ndarray] = None):
+        self.matrix = matrix
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float32)
+        if matrix.dtype == np.float16:
+            # Largest row norm, for the float16 relative rounding bound
+            norms = np.concatenate([
+                np.linalg.norm(matrix[start:start + BLOCK_ROWS].astype(np.float32), axis=1)
+                for start in range(0, len(matrix), BLOCK_ROWS)
+            ]) if len(matrix) else np.zeros(1, dtype=np.float32)
+            self.max_row_norm = float(norms.max())
+
+    @property
+    def dtype(self) -> str:
+        return str(self.matrix.dtype)
+
+    def scores(self, query: np.ndarray, rows: RowSelection = None) -> Tuple[np.ndarray, float]:
+        """Approximate similarities for the selected rows and their maximum absolute error."""
+        query = query.astype(np.float32)
+        if self.scale is not None:
+            approx = blockwise_dot(select(self.matrix, rows), query * self.scale)
+        else:
+            approx = blockwise_dot(select(self.matrix, rows), query)
+        return approx, float(self.error_bound(query))
+
+    def batch_scores(self, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """scores() over every row for a (queries, dim) stack: a score matrix and one error per query."""
+        queries = queries.astype(np.float32)
+        if self.scale is not None:
+            approx = blockwise_dot(self.matrix, queries * self.scale)
+        else:
+            approx = blockwise_dot(self.matrix, queries)
+        return approx, self.error_bound(queries)
+
+    def error_bound(self, query: np.ndarray) -> Union[float, np.ndarray]:
+        """Maximum absolute error of approximate scores for a query (or each row of a stack)."""
+        if self.scale is not None:
+            # Each stored value is within scale / 2 of the original
+            error = 0.5 * (np.abs(query) @ self.scale)
+        else:
+            # float16 keeps 11 significant bits (plus the subnormal floor)
+            error = np.linalg.norm(query, axis=-1) * self.max_row_norm * 2.0 ** -11 \
+                + np.abs(query).sum(axis=-1) * 2.0 ** -25
+        return error + ROUNDING_SLACK
+
+
+def shortlist(approx: np.ndarray, error: float, multipliers: np.ndarray, k: int) -> np.ndarray:
+    """
+    Positions that could be in the exact top-k of approx * multipliers.
+
+    The exact boosted score of each row lies within
+    [(approx - error) * m, (approx + error) * m], so any row whose upper bound
+    is below the k-th best lower bound can be discarded without changing the
+    final ranking. Rows that cannot score above zero are dropped as well.
+    """
+    upper = (approx + error) * multipliers
+    if k < len(approx):
+        lower = (approx - error) * multipliers
+        kth_lower = lower[np.argpartition(lower, len(lower) - k)[len(lower) - k:]].min()
+        return np.flatnonzero((upper >= kth_lower) & (upper > 0))
+    return np.flatnonzero(upper > 0)
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index: chunks grouped by their nearest k-means centroid.
+    A search scores only the chunks in the nprobe lists nearest to the query.
+    """
+
+    def __init__(self, centroids: np.ndarray, list_rows: np.ndarray, list_offsets: np.ndarray):
+        self.centroids = centroids
+        self.list_rows = list_rows
+        self.list_offsets = list_offsets
+
+    @classmethod
+    def load(cls, path: Path) -> "IVFIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["centroids"], data["list_rows"], data["list_offsets"])
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def candidate_rows(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """Sorted chunk ids in the nprobe lists nearest to the query."""
+        nprobe = min(nprobe, self.nlist)
+        centroid_scores = self.centroids @ query
+        nearest = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        offsets = self.list_offsets
+        return np.sort(np.concatenate([self.list_rows[offsets[c]:offsets[c + 1]] for c in nearest]))
+
+
+class ActPartition:
+    """
+    Maps each act to the embedding rows that belong to it.
+
+    The embeddings are written act by act, so each act normally occupies a
+    contiguous (start, end) slice and filtered searches score a view of the
+    matrix without copying it. Acts whose chunks are not contiguous fall back
+    to a sorted index array.
+    """
+
+    def __init__(self, act_codes: np.ndarray, act_keys: Sequence[Tuple[str, str]]):
+        """
+        Args:
+            act_codes: Act id for every chunk (see BoostIndex)
+            act_keys: Lower-cased (act_title, act_short_name) for each act id
+        """
+        self.act_keys = list(act_keys)
+        self.act_rows: Dict[int, Union[slice, np.ndarray]] = {}
+
+        order = np.argsort(act_codes, kind='stable')
+        boundaries = np.flatnonzero(np.diff(act_codes[order])) + 1
+        for group in np.split(order, boundaries):
+            if not len(group):
+                continue
+            start, end = int(group[0]), int(group[-1]) + 1
+            if end - start == len(group):
+                self.act_rows[int(act_codes[start])] = slice(start, end)
+            else:
+                self.act_rows[int(act_codes[start])] = group.astype(np.int64)
+
+        self._filter_cache: Dict[str, RowSelection] = {}
+
+    def acts_matching(self, act_filter: str) -> List[int]:
+        """Act ids whose title or short name contains the filter text."""
+        act_filter_lower = act_filter.lower()
+        return [
+            code for code, (act_title, act_short) in enumerate(self.act_keys)
+            if act_filter_lower in act_title or act_filter_lower in act_short
+        ]
+
+    def rows_for_filter(self, act_filter: str) -> RowSelection:
+        """Rows to score for an act filter (same matching rule as before)."""
+        if act_filter not in self._filter_cache:
+            codes = [c for c in self.acts_matching(act_filter) if c in self.act_rows]
+            if len(codes) == 1:
+                rows = self.act_rows[codes[0]]
+            else:
+                parts = [
+                    np.arange(r.start, r.stop) if isinstance(r, slice) else r
+                    for r in (self.act_rows[c] for c in codes)
+                ]
+                rows = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+            self._filter_cache[act_filter] = rows
+        return self._filter_cache[act_filter]
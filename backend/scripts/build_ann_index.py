@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+build_ann_index.py
+
+Builds an IVF (inverted file) approximate nearest-neighbour index over the
+chunk embeddings. Vectors are clustered with spherical k-means (pure NumPy)
+and grouped into one inverted list per centroid, so a search only scores
+the lists nearest to the query.
+
+Saves data/embeddings/ivf_index.npz next to embeddings.npy and prints,
+for a range of nprobe values, the recall of the backend's final ranking
+(similarity times heading, overview and key-section boosts) against an
+exhaustive search. The backend only uses the index when ANN_NPROBE is set.
+
+Run from the magna root directory (after generate_embeddings.py):
+    cd ~/Desktop/magna
+    python backend/scripts/build_ann_index.py
+    python backend/scripts/build_ann_index.py --nlist 1024 --nprobe 4 8 16 32
+    python backend/scripts/build_ann_index.py --queries logged_questions.txt
+"""
+
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+from typing import List, Optional, Tuple
+from datetime import datetime
+
+# Ranking code shared with the backend
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app.acts_registry import ACTS_REGISTRY
+from app.boosting import BoostIndex
+from app.key_sections import KEY_SECTIONS
+from app.metadata_store import MetadataStore
+from app.query_analysis import get_key_sections_for_query
+from app.retrieval import IVFIndex, global_indices, select, top_k_indices
+
+# Configuration - paths relative to magna root
+EMBEDDINGS_DIR = Path("data/embeddings")
+INDEX_FILE = "ivf_index.npz"
+
+BLOCK_ROWS = 8192  # Rows assigned to centroids at a time
+DEFAULT_ITERATIONS = 20
+DEFAULT_TRAIN_SIZE = 65536
+DEFAULT_NPROBE = [1, 2, 4, 8, 16, 32, 64]
+EVAL_QUERIES = 200
+EVAL_TOP_K = 10
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows (zero rows are left as zero)."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the most similar centroid for every vector."""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def train_kmeans(vectors: np.ndarray, nlist: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Spherical k-means: centroids are unit vectors, assignment by dot product."""
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+
+    for iteration in range(iterations):
+        labels = assign(vectors, centroids)
+
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=nlist)
+        present = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[present]
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+
+        new_centroids = centroids.copy()
+        new_centroids[present] = normalize(sums)
+
+        # Re-seed empty clusters from random vectors
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            new_centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+
+        shift = float(np.abs(new_centroids - centroids).max())
+        centroids = new_centroids
+        print(f"  Iteration {iteration + 1}/{iterations}: {len(empty)} empty lists, max shift {shift:.5f}")
+        if shift < 1e-4:
+            break
+
+    return centroids.astype(np.float32)
+
+
+def build_inverted_lists(labels: np.ndarray, nlist: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Chunk ids grouped by list, plus the start offset of each list."""
+    list_rows = np.argsort(labels, kind='stable').astype(np.int32)
+    list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=nlist), out=list_offsets[1:])
+    return list_rows, list_offsets
+
+
+def load_metadata():
+    """Chunk metadata as the backend loads it (columnar store, else metadata.json)."""
+    store_dir = EMBEDDINGS_DIR / "metadata_store"
+    if MetadataStore.exists(store_dir):
+        return MetadataStore(store_dir)
+    with open(EMBEDDINGS_DIR / "metadata.json", 'r') as f:
+        return json.load(f)
+
+
+def sample_queries(metadata, rng: np.random.Generator) -> List[str]:
+    """
+    Evaluation questions when no --queries file is given: one per key-section
+    topic, an overview question per registered Act and section headings, so
+    every kind of boost is exercised.
+    """
+    queries = [f"What does the law say about {topic}?" for topic in KEY_SECTIONS]
+    queries += [f"What is the {info['title']}?" for info in ACTS_REGISTRY.values()]
+    if len(queries) < EVAL_QUERIES:
+        rows = rng.choice(len(metadata), min(EVAL_QUERIES - len(queries), len(metadata)), replace=False)
+        queries += [metadata[int(row)]["section_heading"] or metadata[int(row)]["text"][:100] for row in rows]
+    if len(queries) > EVAL_QUERIES:
+        queries = [queries[i] for i in np.sort(rng.choice(len(queries), EVAL_QUERIES, replace=False))]
+    return queries
+
+
+def boosted_ranking(embeddings: np.ndarray, boost_index: BoostIndex, query: str,
+                    query_embedding: np.ndarray, ann_index: Optional[IVFIndex], nprobe: int) -> Tuple[np.ndarray, int]:
+    """
+    Top EVAL_TOP_K chunk ids as ranked by search_similar for an unfiltered
+    query (full precision), and the number of rows scored.
+    """
+    key_sections = get_key_sections_for_query(query)
+    rows = None
+    if ann_index is not None:
+        rows = np.union1d(
+            ann_index.candidate_rows(query_embedding, nprobe),
+            boost_index.key_section_rows(key_sections)
+        )
+    multipliers = boost_index.multipliers(query, key_sections, rows)
+    similarities = np.dot(select(embeddings, rows), query_embedding) * multipliers
+    top_local = top_k_indices(similarities, EVAL_TOP_K, min_score=0)
+    return global_indices(rows, top_local), len(similarities)
+
+
+def recall_report(embeddings: np.ndarray, ann_index: IVFIndex, queries: List[str],
+                  model_name: str, nprobe_values: List[int]):
+    """Recall@k of the boosted IVF ranking against the boosted exhaustive ranking for each nprobe."""
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        print("sentence-transformers not installed, skipping the recall report")
+        print("Run: pip install sentence-transformers")
+        return
+
+    print(f"Encoding {len(queries)} evaluation queries with {model_name}...")
+    query_embeddings = SentenceTransformer(model_name).encode(queries, convert_to_numpy=True).astype(np.float32)
+    boost_index = BoostIndex(load_metadata())
+
+    start = time.perf_counter()
+    exact = [
+        set(boosted_ranking(embeddings, boost_index, query, q, None, 0)[0].tolist())
+        for query, q in zip(queries, query_embeddings)
+    ]
+    brute_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    expected_total = max(sum(len(expected) for expected in exact), 1)
+
+    print(f"\n{'nprobe':>8} {'recall@' + str(EVAL_TOP_K):>10} {'scanned':>9} {'ms/query':>9}")
+    print(f"{'brute':>8} {1.0:>10.3f} {1.0:>9.1%} {brute_ms:>9.2f}")
+    for nprobe in nprobe_values:
+        hits = 0
+        scanned = 0
+        start = time.perf_counter()
+        for query, q, expected in zip(queries, query_embeddings, exact):
+            found, rows_scored = boosted_ranking(embeddings, boost_index, query, q, ann_index, nprobe)
+            hits += len(expected.intersection(found.tolist()))
+            scanned += rows_scored
+        ivf_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        recall = hits / expected_total
+        print(f"{nprobe:>8} {recall:>10.3f} {scanned / (len(queries) * len(embeddings)):>9.1%} {ivf_ms:>9.2f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build an IVF index over the chunk embeddings")
+    parser.add_argument("--nlist", type=int, help="Number of inverted lists (default: 4 * sqrt(chunks))")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="k-means iterations")
+    parser.add_argument("--train-size", type=int, default=DEFAULT_TRAIN_SIZE, help="Vectors sampled for k-means")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=DEFAULT_NPROBE, help="nprobe values to report")
+    parser.add_argument(
+        "--queries",
+        type=Path,
+        help="Evaluation questions, one per line (e.g. exported from the analytics table)"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    print("=" * 60)
+    print("NZ Legislation ANN Index Builder")
+    print("=" * 60)
+
+    embeddings_path = EMBEDDINGS_DIR / "embeddings.npy"
+    if not embeddings_path.exists():
+        print(f"\nError: {embeddings_path} not found")
+        print("Please run generate_embeddings.py first.")
+        return
+
+    embeddings = np.load(embeddings_path, mmap_mode="r", allow_pickle=False)
+    total = len(embeddings)
+    nlist = args.nlist or max(1, int(4 * np.sqrt(total)))
+    nlist = min(nlist, total)
+    print(f"\nLoaded {total:,} embeddings (dimension {embeddings.shape[1]})")
+
+    rng = np.random.default_rng(args.seed)
+    train_rows = np.sort(rng.choice(total, min(args.train_size, total), replace=False))
+    training = normalize(np.asarray(embeddings[train_rows], dtype=np.float32))
+
+    print(f"\nTraining {nlist:,} centroids on {len(training):,} vectors...")
+    centroids = train_kmeans(training, nlist, args.iterations, rng)
+
+    print("\nAssigning all chunks to lists...")
+    labels = assign(embeddings, centroids)
+    list_rows, list_offsets = build_inverted_lists(labels, nlist)
+    sizes = np.diff(list_offsets)
+    print(f"List sizes: min {sizes.min()}, median {int(np.median(sizes))}, max {sizes.max()}")
+
+    index_path = EMBEDDINGS_DIR / INDEX_FILE
+    np.savez(index_path, centroids=centroids, list_rows=list_rows, list_offsets=list_offsets)
+
+    # Record the index in config.json alongside the embeddings it was built from;
+    # the backend only loads it for the same embeddings build
+    config_path = EMBEDDINGS_DIR / "config.json"
+    config = {}
+    if config_path.exists():
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        config["ann_index"] = {
+            "type": "ivf",
+            "file": INDEX_FILE,
+            "nlist": nlist,
+            "rows": total,
+            "embeddings_generated_at": config.get("generated_at"),
+            "built_at": datetime.now().isoformat()
+        }
+        with open(config_path, 'w') as f:
+            json.dump(config, f, indent=2)
+
+    print("\n" + "-" * 40)
+    print("Search recall vs exhaustive search (boosts included)...")
+    if args.queries:
+        with open(args.queries, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = sample_queries(load_metadata(), rng)
+    model_name = config.get("embedding_model", "all-MiniLM-L6-v2")
+    recall_report(embeddings, IVFIndex(centroids, list_rows, list_offsets), queries, model_name, args.nprobe)
+
+    print("\n" + "=" * 60)
+    print("INDEX COMPLETE!")
+    print("=" * 60)
+    print(f"Index saved to: {index_path.absolute()}")
+    print("The backend ignores the index until ANN_NPROBE is set; pick the smallest")
+    print("nprobe whose search recall above is acceptable.")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,10 @@ chunk_legislation.py
 
 Breaks parsed legislation JSON into smaller chunks suitable for RAG.
 
+Chunks are written one Act at a time: a {act}_chunks.json file per Act and
+one JSON object per line in all_chunks.jsonl (read in batches by
+generate_embeddings.py), so memory use is bounded by the largest Act.
+
 Run from the magna root directory:
     cd ~/Desktop/magna
     python backend/scripts/chunk_legislation.py
@@ -35,6 +39,9 @@ MAX_CHUNK_TOKENS = 512
 OVERLAP_TOKENS = 50
 MIN_CHUNK_TOKENS = 50
 
+# Combined newline-delimited output read by generate_embeddings.py
+CHUNKS_FILE = "all_chunks.jsonl"
+
 
 def count_tokens(text: str) -> int:
     """Count tokens in text."""
@@ -194,29 +201,37 @@ def main():
     
     print(f"\nFound {len(json_files)} act files to process:\n")
     
-    all_chunks = []
+    total_chunks = 0
+    total_tokens = 0
     chunks_by_act = {}
     
-    for json_path in sorted(json_files):
-        act_chunks = process_act(json_path)
-        all_chunks.extend(act_chunks)
-        
-        act_name = json_path.stem
-        chunks_by_act[act_name] = len(act_chunks)
-        
-        act_output_path = OUTPUT_DIR / f"{act_name}_chunks.json"
-        with open(act_output_path, 'w', encoding='utf-8') as f:
-            json.dump(act_chunks, f, ensure_ascii=False)
+    # Combined chunks, appended one Act at a time
+    combined_path = OUTPUT_DIR / CHUNKS_FILE
+    with open(combined_path, 'w', encoding='utf-8') as combined:
+        for json_path in sorted(json_files):
+            act_chunks = process_act(json_path)
+            
+            act_name = json_path.stem
+            chunks_by_act[act_name] = len(act_chunks)
+            
+            act_output_path = OUTPUT_DIR / f"{act_name}_chunks.json"
+            with open(act_output_path, 'w', encoding='utf-8') as f:
+                json.dump(act_chunks, f, ensure_ascii=False)
+            
+            for chunk in act_chunks:
+                combined.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+            total_chunks += len(act_chunks)
+            total_tokens += sum(c["metadata"]["token_count"] for c in act_chunks)
     
-    # Save combined chunks
-    combined_path = OUTPUT_DIR / "all_chunks.json"
-    with open(combined_path, 'w', encoding='utf-8') as f:
-        json.dump(all_chunks, f, ensure_ascii=False)
+    # Superseded by all_chunks.jsonl
+    legacy_path = OUTPUT_DIR / "all_chunks.json"
+    if legacy_path.exists():
+        legacy_path.unlink()
     
     # Save index
     index_data = {
         "generated_at": datetime.now().isoformat(),
-        "total_chunks": len(all_chunks),
+        "total_chunks": total_chunks,
         "chunk_config": {
             "max_tokens": MAX_CHUNK_TOKENS,
             "overlap_tokens": OVERLAP_TOKENS,
@@ -229,14 +244,12 @@ def main():
     with open(index_path, 'w', encoding='utf-8') as f:
         json.dump(index_data, f, indent=2)
     
-    total_tokens = sum(c["metadata"]["token_count"] for c in all_chunks)
-    
     print("\n" + "=" * 60)
     print("CHUNKING COMPLETE!")
     print("=" * 60)
-    print(f"Total chunks: {len(all_chunks):,}")
+    print(f"Total chunks: {total_chunks:,}")
     print(f"Total tokens: {total_tokens:,}")
-    print(f"Avg tokens/chunk: {total_tokens // len(all_chunks) if all_chunks else 0}")
+    print(f"Avg tokens/chunk: {total_tokens // total_chunks if total_chunks else 0}")
     print(f"\nOutput: {OUTPUT_DIR.absolute()}")
 
 
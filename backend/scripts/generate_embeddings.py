@@ -5,31 +5,251 @@ generate_embeddings.py
 Generates vector embeddings for legislation chunks.
 Uses simple JSON storage (no ChromaDB) for Python 3.14 compatibility.
 
+Chunks are read from all_chunks.jsonl in batches and every output is
+written as it goes (embeddings into a memory-mapped .npy), so memory use is
+bounded by a batch rather than the corpus. Outputs are written to .partial
+files and only replace the previous build once every batch has succeeded.
+
 Run from the magna root directory:
     cd ~/Desktop/magna
     python backend/scripts/generate_embeddings.py
+    python backend/scripts/generate_embeddings.py --quantize int8
+    python backend/scripts/generate_embeddings.py --incremental
 """
 
+import os
+import sys
 import json
+import heapq
+import shutil
+import hashlib
+import argparse
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from datetime import datetime
 
+# Top-k selection shared with the backend
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app.retrieval import top_k_indices
+
 # Configuration - paths relative to magna root
 CHUNKS_DIR = Path("data/processed/chunks")
+CHUNKS_FILE = "all_chunks.jsonl"
 EMBEDDINGS_DIR = Path("data/embeddings")
 
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"  # Fast and good quality
 BATCH_SIZE = 100
 
+# Chunks read, encoded and written per step
+READ_BATCH_SIZE = 5000
+
+# Rows per block when writing quantized copies
+QUANTIZE_BLOCK_ROWS = 65536
+
+# Files written by write_quantized for each --quantize choice
+QUANTIZED_FILES = {
+    "int8": ["embeddings_int8.npy", "embeddings_int8_scale.npy"],
+    "float16": ["embeddings_float16.npy"]
+}
+
+# Columnar metadata store (read by backend/app/metadata_store.py)
+METADATA_STORE_DIR = "metadata_store"
+METADATA_STORE_VERSION = 1
+# text_hash is only read back by --incremental builds
+STRING_COLUMNS = ["id", "text", "section_number", "section_heading", "section_url", "text_hash"]
+ACT_COLUMNS = ["act_title", "act_short_name", "act_url"]
+
+# Built by build_ann_index.py from embeddings.npy; stale once rows change
+ANN_INDEX_FILE = "ivf_index.npz"
+
 
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     """Calculate cosine similarity between two vectors."""
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
 
+def section_ordinal(section_number: str) -> int:
+    """Numeric value of a plain section number, or -1 (e.g. "22A", "Schedule 1")."""
+    section_number = section_number.strip()
+    return int(section_number) if section_number.isdigit() else -1
+
+
+def text_hash(text: str) -> str:
+    """Fingerprint of the exact text passed to the model."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def count_chunks(chunks_path: Path) -> int:
+    with open(chunks_path, 'r', encoding='utf-8') as f:
+        return sum(1 for line in f if line.strip())
+
+
+def iter_chunk_batches(chunks_path: Path, batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Chunks from a JSONL file, batch_size at a time."""
+    batch = []
+    with open(chunks_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            batch.append(json.loads(line))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def read_string_column(store_dir: Path, column: str) -> List[str]:
+    offsets = np.load(store_dir / f"{column}.offsets.npy", allow_pickle=False)
+    blob = (store_dir / f"{column}.bin").read_bytes()
+    return [blob[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def load_previous_build(embedding_dim: int) -> Optional[Tuple[np.ndarray, Dict[Tuple[str, str], int]]]:
+    """
+    Embeddings of the existing build and a (chunk id, text hash) -> row map.
+
+    Returns None when there is no reusable build: files missing, a different
+    model or dimension, or a metadata store written without text hashes.
+    """
+    config_path = EMBEDDINGS_DIR / "config.json"
+    embeddings_path = EMBEDDINGS_DIR / "embeddings.npy"
+    store_dir = EMBEDDINGS_DIR / METADATA_STORE_DIR
+    if not (config_path.exists() and embeddings_path.exists() and (store_dir / "manifest.json").exists()):
+        print("No previous build found, encoding every chunk")
+        return None
+
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    if config.get("embedding_model") != EMBEDDING_MODEL or config.get("embedding_dimension") != embedding_dim:
+        print(f"Previous build used {config.get('embedding_model')}, encoding every chunk")
+        return None
+
+    with open(store_dir / "manifest.json", 'r') as f:
+        manifest = json.load(f)
+    embeddings = np.load(embeddings_path, mmap_mode='r')
+    if "text_hash" not in manifest.get("string_columns", []) or manifest["rows"] != len(embeddings):
+        print("Previous build has no text hashes, encoding every chunk")
+        return None
+
+    ids = read_string_column(store_dir, "id")
+    hashes = read_string_column(store_dir, "text_hash")
+    rows = {key: row for row, key in enumerate(zip(ids, hashes))}
+    return embeddings, rows
+
+
+class MetadataStoreWriter:
+    """
+    Write chunk metadata as memory-mappable columns, one batch at a time.
+
+    Act-level fields go in a small act table referenced by an int16 act id.
+    String columns are concatenated UTF-8 blobs with an int64 offsets array.
+    """
+
+    def __init__(self, store_dir: Path, rows: int):
+        store_dir.mkdir(parents=True, exist_ok=True)
+        self.store_dir = store_dir
+        self.manifest_path = store_dir / "manifest.json"
+        if self.manifest_path.exists():
+            self.manifest_path.unlink()
+
+        self.rows = rows
+        self.row = 0
+        self.acts: Dict[tuple, int] = {}
+        self.act_ids = np.empty(rows, dtype=np.int16)
+        self.ordinals = np.empty(rows, dtype=np.int32)
+        self.offsets = {column: np.zeros(rows + 1, dtype=np.int64) for column in STRING_COLUMNS}
+        self.blobs = {column: open(store_dir / f"{column}.bin", 'wb') for column in STRING_COLUMNS}
+
+    def add(self, meta: Dict[str, Any]):
+        i = self.row
+        act_key = tuple(meta[col] for col in ACT_COLUMNS)
+        self.act_ids[i] = self.acts.setdefault(act_key, len(self.acts))
+        self.ordinals[i] = section_ordinal(meta["section_number"])
+        for column in STRING_COLUMNS:
+            value = meta[column].encode('utf-8')
+            self.blobs[column].write(value)
+            self.offsets[column][i + 1] = self.offsets[column][i] + len(value)
+        self.row += 1
+
+    def close(self):
+        for blob in self.blobs.values():
+            blob.close()
+        for column, offsets in self.offsets.items():
+            np.save(self.store_dir / f"{column}.offsets.npy", offsets)
+        np.save(self.store_dir / "act_id.npy", self.act_ids)
+        np.save(self.store_dir / "section_ordinal.npy", self.ordinals)
+        with open(self.store_dir / "acts.json", 'w', encoding='utf-8') as f:
+            json.dump([dict(zip(ACT_COLUMNS, key)) for key in self.acts], f, ensure_ascii=False)
+
+        # Manifest last, so a partially written store is never picked up
+        manifest = {
+            "format_version": METADATA_STORE_VERSION,
+            "rows": self.rows,
+            "string_columns": STRING_COLUMNS,
+            "act_columns": ACT_COLUMNS
+        }
+        with open(self.manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+
+def write_quantized(embeddings: np.ndarray, kind: str, output_dir: Path) -> Dict[str, str]:
+    """
+    Write a compact copy of the embeddings for candidate shortlisting.
+
+    int8 uses a symmetric per-dimension scale (max |value| / 127);
+    float16 is a plain cast. Works through the rows in blocks so a
+    memory-mapped input is never loaded whole. Returns the config entry
+    describing the files.
+    """
+    blocks = [(start, min(start + QUANTIZE_BLOCK_ROWS, len(embeddings)))
+              for start in range(0, len(embeddings), QUANTIZE_BLOCK_ROWS)]
+
+    if kind == "int8":
+        scale = np.zeros(embeddings.shape[1], dtype=np.float32)
+        for start, end in blocks:
+            np.maximum(scale, np.abs(embeddings[start:end]).max(axis=0), out=scale)
+        scale /= 127.0
+        scale[scale == 0] = 1.0
+        quantized = np.lib.format.open_memmap(
+            output_dir / "embeddings_int8.npy", mode='w+', dtype=np.int8, shape=embeddings.shape
+        )
+        for start, end in blocks:
+            quantized[start:end] = np.clip(np.rint(embeddings[start:end] / scale), -127, 127)
+        quantized.flush()
+        del quantized
+        np.save(output_dir / "embeddings_int8_scale.npy", scale)
+        return {"dtype": "int8", "file": "embeddings_int8.npy", "scale_file": "embeddings_int8_scale.npy"}
+
+    halves = np.lib.format.open_memmap(
+        output_dir / "embeddings_float16.npy", mode='w+', dtype=np.float16, shape=embeddings.shape
+    )
+    for start, end in blocks:
+        halves[start:end] = embeddings[start:end]
+    halves.flush()
+    del halves
+    return {"dtype": "float16", "file": "embeddings_float16.npy"}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate embeddings for legislation chunks")
+    parser.add_argument(
+        "--quantize",
+        choices=["int8", "float16"],
+        help="Also write a compact copy of the embeddings (used with EMBEDDINGS_PRECISION)"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Reuse vectors from the previous build for chunks whose id and text are unchanged"
+    )
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+
     print("=" * 60)
     print("NZ Legislation Embedding Generator")
     print("=" * 60)
@@ -42,17 +262,19 @@ def main():
         print("Run: pip install sentence-transformers")
         return
     
-    # Load chunks
-    chunks_path = CHUNKS_DIR / "all_chunks.json"
+    # Count chunks (read in batches below)
+    chunks_path = CHUNKS_DIR / CHUNKS_FILE
     if not chunks_path.exists():
         print(f"\nError: {chunks_path} not found")
         print("Please run chunk_legislation.py first.")
         return
     
-    print(f"\nLoading chunks from {chunks_path}...")
-    with open(chunks_path, 'r', encoding='utf-8') as f:
-        chunks = json.load(f)
-    print(f"Loaded {len(chunks):,} chunks")
+    print(f"\nCounting chunks in {chunks_path}...")
+    total_chunks = count_chunks(chunks_path)
+    print(f"Found {total_chunks:,} chunks")
+    if not total_chunks:
+        print("Please run chunk_legislation.py first.")
+        return
     
     # Initialize embedding model
     print(f"\nLoading embedding model: {EMBEDDING_MODEL}")
@@ -61,102 +283,201 @@ def main():
     embedding_dim = model.get_sentence_embedding_dimension()
     print(f"Model loaded. Dimension: {embedding_dim}")
     
-    # Prepare texts for embedding
-    print("\nPreparing texts...")
-    texts = []
-    for chunk in chunks:
-        text = chunk.get("text", "")
-        meta = chunk.get("metadata", {})
-        
-        # Add context for better retrieval
-        prefix = f"{meta.get('act_title', '')} Section {meta.get('section_number', '')}: "
-        texts.append(prefix + text)
-    
-    # Generate embeddings
-    print(f"\nGenerating embeddings for {len(texts):,} chunks...")
-    print("This will take a few minutes...\n")
+    previous_embeddings, previous_rows = None, {}
+    if args.incremental:
+        print("\nLoading previous build...")
+        previous = load_previous_build(embedding_dim)
+        if previous is not None:
+            previous_embeddings, previous_rows = previous
     
-    embeddings = model.encode(
-        texts,
-        show_progress_bar=True,
-        batch_size=BATCH_SIZE,
-        convert_to_numpy=True
-    )
-    print(f"\nGenerated {len(embeddings):,} embeddings")
+    # Test retrieval query, scored against each batch as it is written
+    test_query = "What is the maximum bond for a residential tenancy?"
+    query_embedding = model.encode(test_query, convert_to_numpy=True)
+    # Min-heap of (score, -chunk index, metadata): ties keep the lower chunk index
+    top_results: List[Tuple[float, int, Dict[str, Any]]] = []
     
     # Create output directory
     EMBEDDINGS_DIR.mkdir(parents=True, exist_ok=True)
     
-    # Save embeddings as numpy array
+    # Every output goes to a side file until all batches are done, so a failed
+    # run leaves the previous build intact (and it may still be mapped)
     embeddings_path = EMBEDDINGS_DIR / "embeddings.npy"
-    print(f"\nSaving embeddings to {embeddings_path}...")
-    np.save(embeddings_path, embeddings)
+    partial_path = EMBEDDINGS_DIR / "embeddings.partial.npy"
+    embeddings = np.lib.format.open_memmap(
+        partial_path, mode='w+', dtype=np.float32, shape=(total_chunks, embedding_dim)
+    )
     
-    # Save chunk metadata (without the full text to save space)
     metadata_path = EMBEDDINGS_DIR / "metadata.json"
-    print(f"Saving metadata to {metadata_path}...")
-    
-    metadata_list = []
-    for i, chunk in enumerate(chunks):
-        meta = chunk.get("metadata", {})
-        metadata_list.append({
-            "id": chunk.get("id", str(i)),
-            "text": chunk.get("text", "")[:1000],  # Truncate for storage
-            "act_title": meta.get("act_title", ""),
-            "act_short_name": meta.get("act_short_name", ""),
-            "section_number": meta.get("section_number", ""),
-            "section_heading": meta.get("section_heading", ""),
-            "section_url": meta.get("section_url", ""),
-            "act_url": meta.get("act_url", "")
-        })
-    
-    with open(metadata_path, 'w', encoding='utf-8') as f:
-        json.dump(metadata_list, f, ensure_ascii=False)
+    metadata_partial_path = EMBEDDINGS_DIR / "metadata.json.partial"
+    store_dir = EMBEDDINGS_DIR / METADATA_STORE_DIR
+    store_partial_dir = EMBEDDINGS_DIR / f"{METADATA_STORE_DIR}.partial"
+    if store_partial_dir.exists():
+        shutil.rmtree(store_partial_dir)
+    store = MetadataStoreWriter(store_partial_dir, total_chunks)
+    
+    print(f"\nGenerating embeddings for {total_chunks:,} chunks...")
+    print("This will take a few minutes...\n")
+    
+    reused = 0
+    encoded = 0
+    start = 0
+    with open(metadata_partial_path, 'w', encoding='utf-8') as metadata_file:
+        metadata_file.write("[")
+        for chunks in iter_chunk_batches(chunks_path, READ_BATCH_SIZE):
+            end = start + len(chunks)
+            
+            # Prepare texts for embedding
+            texts = []
+            for chunk in chunks:
+                text = chunk.get("text", "")
+                meta = chunk.get("metadata", {})
+                
+                # Add context for better retrieval
+                prefix = f"{meta.get('act_title', '')} Section {meta.get('section_number', '')}: "
+                texts.append(prefix + text)
+            
+            # Save chunk metadata (without the full text to save space)
+            metadata_list = []
+            for i, chunk in enumerate(chunks, start):
+                meta = chunk.get("metadata", {})
+                metadata_list.append({
+                    "id": chunk.get("id", str(i)),
+                    "text": chunk.get("text", "")[:1000],  # Truncate for storage
+                    "text_hash": text_hash(texts[i - start]),
+                    "act_title": meta.get("act_title", ""),
+                    "act_short_name": meta.get("act_short_name", ""),
+                    "section_number": meta.get("section_number", ""),
+                    "section_heading": meta.get("section_heading", ""),
+                    "section_url": meta.get("section_url", ""),
+                    "act_url": meta.get("act_url", "")
+                })
+            
+            batch_embeddings = np.empty((len(chunks), embedding_dim), dtype=np.float32)
+            to_encode = list(range(len(chunks)))
+            if previous_rows:
+                new_rows, old_rows, to_encode = [], [], []
+                for i, meta in enumerate(metadata_list):
+                    row = previous_rows.get((meta["id"], meta["text_hash"]))
+                    if row is None:
+                        to_encode.append(i)
+                    else:
+                        new_rows.append(i)
+                        old_rows.append(row)
+                if new_rows:
+                    batch_embeddings[new_rows] = previous_embeddings[old_rows]
+                reused += len(new_rows)
+            if to_encode:
+                batch_embeddings[to_encode] = model.encode(
+                    [texts[i] for i in to_encode],
+                    show_progress_bar=False,
+                    batch_size=BATCH_SIZE,
+                    convert_to_numpy=True
+                )
+            encoded += len(to_encode)
+            embeddings[start:end] = batch_embeddings
+            
+            for i, meta in enumerate(metadata_list, start):
+                metadata_file.write(("," if i else "") + "\n" + json.dumps(meta, ensure_ascii=False))
+                store.add(meta)
+            
+            similarities = batch_embeddings @ query_embedding
+            for idx in top_k_indices(similarities, 3):
+                heapq.heappush(top_results, (float(similarities[idx]), -(start + int(idx)), metadata_list[idx]))
+                if len(top_results) > 3:
+                    heapq.heappop(top_results)
+            
+            start = end
+            print(f"  {end:,}/{total_chunks:,} chunks ({reused:,} reused, {encoded:,} encoded)")
+        metadata_file.write("\n]\n")
+    
+    store.close()
+    print(f"\nGenerated {encoded:,} embeddings")
+    
+    # Release the previous build before embeddings.npy is replaced
+    del previous_embeddings
+    print(f"\nSaving embeddings to {embeddings_path}...")
+    embeddings.flush()
+    del embeddings
+    os.replace(partial_path, embeddings_path)
+    os.replace(metadata_partial_path, metadata_path)
+    # A directory cannot be renamed over a non-empty one; swap it via a backup name
+    store_old_dir = EMBEDDINGS_DIR / f"{METADATA_STORE_DIR}.old"
+    if store_old_dir.exists():
+        shutil.rmtree(store_old_dir)
+    if store_dir.exists():
+        os.replace(store_dir, store_old_dir)
+    os.replace(store_partial_dir, store_dir)
+    if store_old_dir.exists():
+        shutil.rmtree(store_old_dir)
+    embeddings = np.load(embeddings_path, mmap_mode='r')
+    print(f"Saved metadata to {metadata_path}")
+    print(f"Saved columnar metadata store to {store_dir}")
+    
+    quantized = None
+    if args.quantize:
+        print(f"Saving {args.quantize} embeddings...")
+        quantized = write_quantized(embeddings, args.quantize, EMBEDDINGS_DIR)
+
+    # Compact copies from an earlier build no longer match embeddings.npy
+    for kind, filenames in QUANTIZED_FILES.items():
+        if kind == args.quantize:
+            continue
+        for filename in filenames:
+            stale_path = EMBEDDINGS_DIR / filename
+            if stale_path.exists():
+                stale_path.unlink()
+                print(f"Removed stale {filename}")
     
     # Save config
     config = {
         "generated_at": datetime.now().isoformat(),
         "embedding_model": EMBEDDING_MODEL,
-        "total_chunks": len(chunks),
+        "total_chunks": total_chunks,
         "embedding_dimension": embedding_dim,
         "embeddings_file": "embeddings.npy",
-        "metadata_file": "metadata.json"
+        "metadata_file": "metadata.json",
+        "metadata_store": METADATA_STORE_DIR,
+        "reused_embeddings": reused,
+        "encoded_embeddings": encoded
     }
+    if quantized:
+        config["quantized"] = quantized
     
     config_path = EMBEDDINGS_DIR / "config.json"
     with open(config_path, 'w') as f:
         json.dump(config, f, indent=2)
     
+    # The IVF index lists rows of the old embeddings.npy
+    ann_index_path = EMBEDDINGS_DIR / ANN_INDEX_FILE
+    if ann_index_path.exists():
+        ann_index_path.unlink()
+        print(f"Removed stale {ANN_INDEX_FILE}; rebuild it with build_ann_index.py")
+    
     # Test retrieval
     print("\n" + "-" * 40)
     print("Testing retrieval...")
-    test_query = "What is the maximum bond for a residential tenancy?"
-    
-    query_embedding = model.encode(test_query, convert_to_numpy=True)
-    
-    # Calculate similarities
-    similarities = np.dot(embeddings, query_embedding)
-    top_indices = np.argsort(similarities)[-3:][::-1]
     
     print(f"\nQuery: '{test_query}'")
     print("\nTop 3 results:")
-    for i, idx in enumerate(top_indices):
-        meta = metadata_list[idx]
+    for i, (score, _, meta) in enumerate(sorted(top_results, key=lambda r: (-r[0], -r[1]))):
         print(f"\n{i+1}. {meta['act_title']} - Section {meta['section_number']}")
-        print(f"   Score: {similarities[idx]:.4f}")
+        print(f"   Score: {score:.4f}")
         print(f"   {meta['text'][:150]}...")
     
     print("\n" + "=" * 60)
     print("EMBEDDING COMPLETE!")
     print("=" * 60)
-    print(f"Total chunks: {len(chunks):,}")
+    print(f"Total chunks: {total_chunks:,}")
     print(f"Embeddings saved to: {EMBEDDINGS_DIR.absolute()}")
     print(f"\nFiles created:")
     print(f"  - embeddings.npy ({embeddings.nbytes / 1024 / 1024:.1f} MB)")
     print(f"  - metadata.json")
+    print(f"  - {METADATA_STORE_DIR}/")
+    if quantized:
+        print(f"  - {quantized['file']}")
     print(f"  - config.json")
     print(f"\nReady for RAG queries!")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
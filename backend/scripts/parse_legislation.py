@@ -5,23 +5,67 @@ parse_legislation.py
 Parses HTML files from legislation.govt.nz and extracts structured content.
 Outputs JSON files with sections, definitions, and metadata.
 
+Acts whose HTML file, ACT_METADATA entry and parser version are unchanged
+since the last run (see data/processed/parse_manifest.json) are skipped and their existing
+JSON is reused. Use --force to re-parse everything.
+
 Run from the magna root directory:
     cd ~/Desktop/magna
     python backend/scripts/parse_legislation.py
+    python backend/scripts/parse_legislation.py --workers 8
+    python backend/scripts/parse_legislation.py --force
 """
 
 import os
 import re
 import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from bs4 import BeautifulSoup
-from typing import Dict, List, Any, Optional
+from lxml import etree
+from typing import Dict, Iterable, List, Any, Optional, Tuple
 
 
 # Configuration - paths relative to magna root
 RAW_HTML_DIR = Path("data/raw/html")
 OUTPUT_DIR = Path("data/processed/json")
+# Kept outside OUTPUT_DIR, which chunk_legislation.py reads as Act files
+MANIFEST_PATH = Path("data/processed/parse_manifest.json")
+
+# Bump whenever a parser change alters the JSON output, so every Act is re-parsed
+PARSER_VERSION = 1
+
+# Provision markup on legislation.govt.nz (class names are matched anywhere in the class attribute)
+HEADING_CLASSES = ['prov-heading', 'heading']
+NUM_CLASSES = ['prov-num', 'section-num']
+BODY_CLASSES = ['prov-body', 'section-body']
+PROV_CLASS = re.compile(r'prov')
+HEADING_CLASS = re.compile('|'.join(HEADING_CLASSES))
+NUM_CLASS = re.compile('|'.join(NUM_CLASSES))
+BODY_CLASS = re.compile('|'.join(BODY_CLASSES))
+HEADING_TAGS = ['h1', 'h2', 'h3', 'h4', 'h5']
+
+# Compiled lookups for the streaming parser. contains() on each class name is the
+# same test as searching the class attribute with the regexes above; text() nodes
+# exclude comments, and script/style contents are skipped as in get_text().
+def _first_with_class(class_names: List[str]) -> etree.XPath:
+    condition = " or ".join(f"contains(@class, '{name}')" for name in class_names)
+    return etree.XPath(f"descendant::*[{condition}][1]")
+
+
+FIRST_HEADING = _first_with_class(HEADING_CLASSES)
+FIRST_HEADING_TAG = etree.XPath(
+    "descendant::*[" + " or ".join(f"self::{tag}" for tag in HEADING_TAGS) + "][1]"
+)
+FIRST_NUM = _first_with_class(NUM_CLASSES)
+FIRST_BODY = _first_with_class(BODY_CLASSES)
+TEXT_NODES = etree.XPath("descendant::text()[not(parent::script or parent::style)]", smart_strings=False)
+
+# (section id, heading, section number, body text) extracted from one provision
+ProvisionFields = Tuple[str, str, str, str]
 
 # Act metadata - maps filename to metadata
 ACT_METADATA = {
@@ -459,65 +503,113 @@ def extract_section_number(heading_text: str) -> Optional[str]:
     return None
 
 
-def parse_legislation_html(html_path: Path, metadata: Dict[str, Any]) -> Dict[str, Any]:
-    """Parse a legislation HTML file and extract structured content."""
-    print(f"  Parsing: {html_path.name}")
-    
-    with open(html_path, 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    
-    soup = BeautifulSoup(html_content, 'lxml')
-    
-    output = {
-        "metadata": {
-            **metadata,
-            "parsed_at": datetime.now().isoformat(),
-            "source_file": html_path.name
-        },
-        "sections": [],
-        "definitions": []
-    }
-    
-    # Find all section elements - legislation.govt.nz uses 'prov' class
-    sections = soup.find_all('div', class_=re.compile(r'prov'))
-    
-    if not sections:
-        # Fallback: try finding by heading structure
-        sections = soup.find_all(['section', 'div'], class_=re.compile(r'section|provision'))
-    
-    print(f"    Found {len(sections)} provision elements")
-    
+def element_text(elem) -> str:
+    """All text inside an lxml element, as BeautifulSoup's get_text() returns it."""
+    return ''.join(TEXT_NODES(elem))
+
+
+def first(matches: list):
+    return matches[0] if matches else None
+
+
+def lxml_provision_fields(section) -> ProvisionFields:
+    """Fields of a provision element from the streaming parser."""
+    section_id = section.get('id', '')
+
+    heading_elem = first(FIRST_HEADING(section))
+    if heading_elem is None:
+        heading_elem = first(FIRST_HEADING_TAG(section))
+    heading = clean_text(element_text(heading_elem)) if heading_elem is not None else ""
+
+    num_elem = first(FIRST_NUM(section))
+    section_num = clean_text(element_text(num_elem)) if num_elem is not None else ""
+    if not section_num:
+        section_num = extract_section_number(heading) or ""
+
+    body_elem = first(FIRST_BODY(section))
+    if body_elem is not None:
+        body_text = clean_text(element_text(body_elem))
+    else:
+        # Get all text minus the heading
+        body_text = clean_text(element_text(section))
+        if heading:
+            body_text = body_text.replace(heading, '', 1).strip()
+
+    return section_id, heading, section_num, body_text
+
+
+def soup_provision_fields(section) -> ProvisionFields:
+    """Fields of a provision element from a BeautifulSoup tree."""
+    section_id = section.get('id', '')
+
+    heading_elem = section.find(class_=HEADING_CLASS)
+    if not heading_elem:
+        heading_elem = section.find(HEADING_TAGS)
+    heading = clean_text(heading_elem.get_text()) if heading_elem else ""
+
+    num_elem = section.find(class_=NUM_CLASS)
+    section_num = clean_text(num_elem.get_text()) if num_elem else ""
+    if not section_num:
+        section_num = extract_section_number(heading) or ""
+
+    body_elem = section.find(class_=BODY_CLASS)
+    if body_elem:
+        body_text = clean_text(body_elem.get_text())
+    else:
+        # Get all text minus the heading
+        body_text = clean_text(section.get_text())
+        if heading:
+            body_text = body_text.replace(heading, '', 1).strip()
+
+    return section_id, heading, section_num, body_text
+
+
+def stream_provisions(html_path: Path) -> Tuple[List[ProvisionFields], int]:
+    """
+    Fields of every div.prov element in document order, from one streaming
+    lxml pass. A provision is extracted when it closes; elements outside any
+    open provision are freed as soon as they end, so memory stays flat.
+
+    Returns the fields and the number of provision elements found.
+    """
+    extracted = []
+    open_provisions = []  # Start order of the provisions currently open
+    found = 0
+
+    for event, elem in etree.iterparse(str(html_path), events=("start", "end"), html=True,
+                                       encoding='utf-8', huge_tree=True):
+        is_provision = elem.tag == 'div' and bool(PROV_CLASS.search(elem.get('class') or ''))
+        if event == "start":
+            if is_provision:
+                open_provisions.append(found)
+                found += 1
+            continue
+
+        if is_provision:
+            order = open_provisions.pop()
+            try:
+                extracted.append((order, lxml_provision_fields(elem)))
+            except Exception as e:
+                print(f"    Warning: Error parsing section: {e}")
+
+        if not open_provisions:
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+    # Nested provisions close before their parents; restore document order
+    extracted.sort(key=lambda item: item[0])
+    return [fields for _, fields in extracted], found
+
+
+def build_sections(provisions: Iterable[ProvisionFields], metadata: Dict[str, Any]) -> List[Dict]:
+    """Section records for provisions in document order, tracking the current Part and Subpart."""
+    sections = []
     current_part = ""
     current_subpart = ""
     
-    for section in sections:
+    for section_id, heading, section_num, body_text in provisions:
         try:
-            # Get section ID for URL linking
-            section_id = section.get('id', '')
-            
-            # Find the section heading
-            heading_elem = section.find(class_=re.compile(r'prov-heading|heading'))
-            if not heading_elem:
-                heading_elem = section.find(['h1', 'h2', 'h3', 'h4', 'h5'])
-            
-            heading = clean_text(heading_elem.get_text()) if heading_elem else ""
-            
-            # Find section number
-            num_elem = section.find(class_=re.compile(r'prov-num|section-num'))
-            section_num = clean_text(num_elem.get_text()) if num_elem else ""
-            if not section_num:
-                section_num = extract_section_number(heading) or ""
-            
-            # Get the body text
-            body_elem = section.find(class_=re.compile(r'prov-body|section-body'))
-            if body_elem:
-                body_text = clean_text(body_elem.get_text())
-            else:
-                # Get all text minus the heading
-                body_text = clean_text(section.get_text())
-                if heading:
-                    body_text = body_text.replace(heading, '', 1).strip()
-            
             if not body_text and not heading:
                 continue
             
@@ -537,7 +629,7 @@ def parse_legislation_html(html_path: Path, metadata: Dict[str, Any]) -> Dict[st
             if section_id:
                 section_url = f"{metadata['url'].replace('/whole.html', '')}/DLM{section_id}" if 'DLM' not in section_id else f"{metadata['url'].replace('/whole.html', '')}/{section_id}"
             
-            output["sections"].append({
+            sections.append({
                 "section_number": section_num,
                 "heading": heading,
                 "level": level,
@@ -552,10 +644,56 @@ def parse_legislation_html(html_path: Path, metadata: Dict[str, Any]) -> Dict[st
         except Exception as e:
             print(f"    Warning: Error parsing section: {e}")
             continue
+
+    return sections
+
+
+def soup_provisions(elements) -> List[ProvisionFields]:
+    provisions = []
+    for element in elements:
+        try:
+            provisions.append(soup_provision_fields(element))
+        except Exception as e:
+            print(f"    Warning: Error parsing section: {e}")
+    return provisions
+
+
+def parse_legislation_html(html_path: Path, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Parse a legislation HTML file and extract structured content."""
+    print(f"  Parsing: {html_path.name}")
+    
+    output = {
+        "metadata": {
+            **metadata,
+            "parsed_at": datetime.now().isoformat(),
+            "source_file": html_path.name
+        },
+        "sections": [],
+        "definitions": []
+    }
+    
+    # Stream all section elements - legislation.govt.nz uses 'prov' class
+    provisions, found = stream_provisions(html_path)
+    soup = None
+    
+    if not found:
+        # Fallback: try finding by heading structure (needs the whole tree)
+        with open(html_path, 'r', encoding='utf-8') as f:
+            soup = BeautifulSoup(f.read(), 'lxml')
+        elements = soup.find_all(['section', 'div'], class_=re.compile(r'section|provision'))
+        found = len(elements)
+        provisions = soup_provisions(elements)
+    
+    print(f"    Found {found} provision elements")
+    
+    output["sections"] = build_sections(provisions, metadata)
     
     # If no sections found with prov class, try a simpler approach
     if not output["sections"]:
         print(f"    Using fallback text extraction...")
+        if soup is None:
+            with open(html_path, 'r', encoding='utf-8') as f:
+                soup = BeautifulSoup(f.read(), 'lxml')
         output["sections"] = extract_by_text_patterns(soup, metadata)
     
     print(f"    Extracted {len(output['sections'])} sections")
@@ -607,8 +745,77 @@ def extract_by_text_patterns(soup: BeautifulSoup, metadata: Dict) -> List[Dict]:
     return sections
 
 
+def act_metadata_for(html_path: Path) -> Dict[str, Any]:
+    """Metadata for an HTML file (defaults for files not in ACT_METADATA)."""
+    return ACT_METADATA.get(html_path.name, {
+        "title": html_path.stem.replace("-", " ").title(),
+        "year": 0,
+        "number": 0,
+        "url": "",
+        "short_name": html_path.stem[:3].upper(),
+        "topics": []
+    })
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def input_fingerprint(html_path: Path) -> Dict[str, Any]:
+    """Everything an Act's parsed JSON depends on."""
+    metadata_json = json.dumps(act_metadata_for(html_path), sort_keys=True, ensure_ascii=False)
+    return {
+        "parser_version": PARSER_VERSION,
+        "html_sha256": file_sha256(html_path),
+        "metadata_sha256": hashlib.sha256(metadata_json.encode('utf-8')).hexdigest()
+    }
+
+
+def load_manifest() -> Dict[str, Any]:
+    if not MANIFEST_PATH.exists():
+        return {}
+    with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f).get("acts", {})
+
+
+def parse_and_save(html_path: Path) -> Dict[str, Any]:
+    """
+    Parse one Act, write its JSON file and return its acts_index.json entry.
+    Runs in a worker process when --workers is above 1.
+    """
+    result = parse_legislation_html(html_path, act_metadata_for(html_path))
+
+    # Save individual JSON file
+    output_path = OUTPUT_DIR / f"{html_path.stem}.json"
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    return {
+        "title": result["metadata"]["title"],
+        "short_name": result["metadata"].get("short_name", ""),
+        "year": result["metadata"].get("year", 0),
+        "sections_count": len(result["sections"]),
+        "file": f"{html_path.stem}.json"
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Parse legislation HTML into structured JSON")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Parse Acts in this many processes (default: 1)")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-parse every Act, even if its inputs are unchanged")
+    return parser.parse_args()
+
+
 def main():
     """Main entry point."""
+    args = parse_args()
+
     print("=" * 60)
     print("NZ Legislation Parser")
     print("=" * 60)
@@ -617,7 +824,7 @@ def main():
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     
     # Find HTML files
-    html_files = list(RAW_HTML_DIR.glob("*.html"))
+    html_files = sorted(RAW_HTML_DIR.glob("*.html"))
     
     if not html_files:
         print(f"\nNo HTML files found in {RAW_HTML_DIR.absolute()}")
@@ -625,30 +832,31 @@ def main():
         return
     
     print(f"\nFound {len(html_files)} HTML files to process:\n")
+
+    # Reuse the JSON of Acts whose inputs match the last run
+    previous = {} if args.force else load_manifest()
+    fingerprints = {html_path: input_fingerprint(html_path) for html_path in html_files}
+    summaries = {}
+    for html_path in html_files:
+        entry = previous.get(html_path.name)
+        if (entry and entry["inputs"] == fingerprints[html_path]
+                and (OUTPUT_DIR / entry["summary"]["file"]).exists()):
+            summaries[html_path] = entry["summary"]
+    to_parse = [html_path for html_path in html_files if html_path not in summaries]
+    print(f"Unchanged (reused): {len(summaries)}, to parse: {len(to_parse)}\n")
     
-    all_acts = []
-    total_sections = 0
-    
-    for html_path in sorted(html_files):
-        # Get metadata for this file
-        metadata = ACT_METADATA.get(html_path.name, {
-            "title": html_path.stem.replace("-", " ").title(),
-            "year": 0,
-            "number": 0,
-            "url": "",
-            "short_name": html_path.stem[:3].upper(),
-            "topics": []
-        })
-        
-        # Parse the HTML
-        result = parse_legislation_html(html_path, metadata)
-        all_acts.append(result)
-        total_sections += len(result["sections"])
-        
-        # Save individual JSON file
-        output_path = OUTPUT_DIR / f"{html_path.stem}.json"
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
+    if args.workers > 1 and len(to_parse) > 1:
+        # Largest Acts first so they don't start last and set the finish time
+        by_size = sorted(to_parse, key=lambda p: p.stat().st_size, reverse=True)
+        print(f"Parsing with {args.workers} worker processes...")
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            summaries.update(zip(by_size, pool.map(parse_and_save, by_size)))
+    else:
+        for html_path in to_parse:
+            summaries[html_path] = parse_and_save(html_path)
+    all_acts = [summaries[html_path] for html_path in html_files]
+
+    total_sections = sum(act["sections_count"] for act in all_acts)
     
     # Save combined index
     index_path = OUTPUT_DIR / "acts_index.json"
@@ -656,33 +864,36 @@ def main():
         "generated_at": datetime.now().isoformat(),
         "total_acts": len(all_acts),
         "total_sections": total_sections,
-        "acts": [
-            {
-                "title": act["metadata"]["title"],
-                "short_name": act["metadata"].get("short_name", ""),
-                "year": act["metadata"].get("year", 0),
-                "sections_count": len(act["sections"]),
-                "file": f"{Path(act['metadata']['source_file']).stem}.json"
-            }
-            for act in all_acts
-        ]
+        "acts": all_acts
     }
     
     with open(index_path, 'w', encoding='utf-8') as f:
         json.dump(index_data, f, indent=2, ensure_ascii=False)
+
+    # Record the inputs of every Act for the next incremental run
+    manifest_data = {
+        "parser_version": PARSER_VERSION,
+        "generated_at": index_data["generated_at"],
+        "acts": {
+            html_path.name: {"inputs": fingerprints[html_path], "summary": summaries[html_path]}
+            for html_path in html_files
+        }
+    }
+    with open(MANIFEST_PATH, 'w', encoding='utf-8') as f:
+        json.dump(manifest_data, f, indent=2, ensure_ascii=False)
     
     print("\n" + "=" * 60)
     print("PARSING COMPLETE!")
     print("=" * 60)
-    print(f"Acts processed: {len(all_acts)}")
+    print(f"Acts processed: {len(all_acts)} ({len(to_parse)} parsed, {len(all_acts) - len(to_parse)} reused)")
     print(f"Total sections: {total_sections}")
     print(f"Output directory: {OUTPUT_DIR.absolute()}")
     print(f"\nFiles created:")
     for act in all_acts:
-        stem = Path(act['metadata']['source_file']).stem
-        print(f"  - {stem}.json ({len(act['sections'])} sections)")
+        print(f"  - {act['file']} ({act['sections_count']} sections)")
     print(f"  - acts_index.json")
+    print(f"  - {MANIFEST_PATH}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
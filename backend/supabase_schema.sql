@@ -48,3 +48,15 @@ ALTER TABLE topic_stats ENABLE ROW LEVEL SECURITY;
 CREATE POLICY "Allow anonymous inserts" ON chat_messages FOR INSERT WITH CHECK (true);
 CREATE POLICY "Allow anonymous inserts" ON analytics FOR INSERT WITH CHECK (true);
 CREATE POLICY "Allow anonymous upserts" ON topic_stats FOR ALL USING (true) WITH CHECK (true);
+
+-- Batched topic counter update: deltas is a JSON array of {"act_name": ..., "delta": ...}.
+-- All counts are incremented atomically in one statement, creating rows as needed.
+CREATE OR REPLACE FUNCTION increment_topic_counts(deltas JSONB)
+RETURNS VOID AS $$
+    INSERT INTO topic_stats (act_name, query_count, last_queried)
+    SELECT d->>'act_name', (d->>'delta')::INTEGER, NOW()
+    FROM jsonb_array_elements(deltas) AS d
+    ON CONFLICT (act_name) DO UPDATE
+    SET query_count = topic_stats.query_count + EXCLUDED.query_count,
+        last_queried = EXCLUDED.last_queried;
+$$ LANGUAGE sql;